@@ -0,0 +1,398 @@
+"""Асинхронные версии читающих представлений API.
+
+При ASYNC_READ_VIEWS (по умолчанию под ASGI) GET-запросы к списку и
+карточке рецепта, тэгам, ингредиентам и подпискам обслуживаются
+корутинами на асинхронном ORM: пока запрос ждёт базу или медленного
+клиента, воркер обслуживает другие. Всё, что здесь не поддержано, —
+другие методы, курсорная навигация, поиск, ошибки в параметрах,
+анонимные запросы к кэшируемым ответам — отдаётся обычному синхронному
+представлению, поэтому ответы совпадают.
+"""
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import Exists, OuterRef
+from django.http import HttpResponse
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from recipes.autocomplete import ingredient_index
+from recipes.catalogue import catalogue
+from recipes.models import Cart, Favorites, Recipe, RecipeIngredient
+from users.models import Follow, User
+from .authentication import JWTAuthentication, user_cache
+from .filters import RECIPE_ORDERINGS
+from .pagination import PageLimitPagination
+from .serializers import (IngredientSerializer, RecipeSerializer,
+                          TagSerializer, UserFollowSerializer)
+from .views import limited_recipes
+
+BOOLEANS = {'true': True, '1': True, 'false': False, '0': False}
+RECIPE_LIST_PARAMS = {
+    'page', 'limit', 'tags', 'author', 'is_favorited',
+    'is_in_shopping_cart', 'ordering',
+}
+SUBSCRIPTION_PARAMS = {'page', 'limit', 'recipes_limit'}
+
+jwt_authentication = JWTAuthentication()
+
+
+class FallbackError(Exception):
+    """Запрос нужно обработать синхронным представлением."""
+
+
+def async_read_view(handler, sync_view, params=(), cached=False):
+    """Представление: GET — корутиной handler, остальное — sync_view.
+
+    params — допустимые параметры строки запроса; cached — анонимные
+    ответы отдаёт кэш синхронного представления. Эти проверки идут до
+    аутентификации, чтобы отданный синхронному пути запрос не стоил
+    лишних обращений к базе.
+    """
+    sync_view = sync_to_async(sync_view)
+    params = set(params)
+
+    @wraps(sync_view.func)
+    async def view(request, *args, **kwargs):
+        if (
+            request.method == 'GET'
+            and 'format' not in kwargs
+            and 'text/html' not in request.META.get('HTTP_ACCEPT', '')
+            and set(request.GET) <= params
+            and not (cached and use_response_cache(request))
+        ):
+            try:
+                request.user = await authenticate(request)
+                return await handler(request, *args, **kwargs)
+            except FallbackError:
+                pass
+        return await sync_view(request, *args, **kwargs)
+
+    return view
+
+
+async def authenticate(request):
+    """Пользователь по заголовку Authorization: Bearer <JWT> или Token."""
+    header = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if not header:
+        return AnonymousUser()
+    if len(header) != 2:
+        raise FallbackError
+    if header[0] == 'Bearer':
+        return await jwt_user(header[1])
+    if header[0] != 'Token':
+        raise FallbackError
+    token = await Token.objects.select_related('user').filter(
+        key=header[1]
+    ).afirst()
+    if token is None or not token.user.is_active:
+        raise FallbackError
+    return token.user
+
+
+async def jwt_user(raw_token):
+    """Как JWTAuthentication: кэш пользователей, запрос только при промахе."""
+    try:
+        token = jwt_authentication.get_validated_token(raw_token.encode())
+    except InvalidToken:
+        raise FallbackError
+    user_id = token.get(api_settings.USER_ID_CLAIM)
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await User.objects.filter(pk=user_id, is_active=True).afirst()
+        if user is None:
+            raise FallbackError
+        user_cache.set(user)
+    return user
+
+
+def json_response(data):
+    response = HttpResponse(
+        JSONRenderer().render(data), content_type='application/json'
+    )
+    response['Vary'] = 'Accept'
+    return response
+
+
+def use_response_cache(request):
+    return (
+        settings.RESPONSE_CACHE['ENABLED']
+        and 'HTTP_AUTHORIZATION' not in request.META
+    )
+
+
+async def paginate(request, queryset):
+    """Страница ?page=&limit= и ссылки как у PageLimitPagination."""
+    size = PageLimitPagination().get_page_size(Request(request))
+    try:
+        number = int(request.GET.get('page', 1))
+    except ValueError:
+        raise FallbackError
+    count = await queryset.acount()
+    pages = max(1, -(-count // size))
+    if not 1 <= number <= pages:
+        raise FallbackError
+    url = request.build_absolute_uri()
+    previous = None
+    if number == 2:
+        previous = remove_query_param(url, 'page')
+    elif number > 2:
+        previous = replace_query_param(url, 'page', number - 1)
+    links = {
+        'count': count,
+        'next': (
+            replace_query_param(url, 'page', number + 1)
+            if number < pages else None
+        ),
+        'previous': previous,
+    }
+    start = (number - 1) * size
+    return queryset[start:start + size], links
+
+
+async def grouped(queryset, key):
+    groups = {}
+    async for item in queryset.aiterator():
+        groups.setdefault(getattr(item, key), []).append(item)
+    return groups
+
+
+async def flagged(queryset, field):
+    return {
+        value async for value in queryset.values_list(
+            field, flat=True
+        ).aiterator()
+    }
+
+
+async def catalogue_snapshot():
+    return catalogue.current() or await sync_to_async(catalogue.load)()
+
+
+async def load_recipes(queryset, user):
+    """Рецепты с тэгами, ингредиентами и отметками пользователя.
+
+    Связи и отметки читаются параллельными запросами по id страницы и
+    раскладываются по рецептам так же, как это делает prefetch_related.
+    Возвращает рецепты и снимок справочника, в котором есть все их тэги и
+    ингредиенты.
+    """
+    recipes = [
+        recipe async for recipe in queryset.select_related(
+            'author'
+        ).aiterator()
+    ]
+    ids = [recipe.id for recipe in recipes]
+    lookups = [
+        grouped(
+            Recipe.tags.through.objects.filter(recipe_id__in=ids)
+            .order_by('id'),
+            'recipe_id',
+        ),
+        grouped(
+            RecipeIngredient.objects.filter(recipe_id__in=ids).order_by('id'),
+            'recipe_id',
+        ),
+    ]
+    if user.is_authenticated:
+        lookups.extend((
+            flagged(
+                Favorites.objects.filter(user=user, recipe_id__in=ids),
+                'recipe_id',
+            ),
+            flagged(
+                Cart.objects.filter(user=user, recipe_id__in=ids),
+                'recipe_id',
+            ),
+            flagged(
+                Follow.objects.filter(user=user, author_id__in={
+                    recipe.author_id for recipe in recipes
+                }),
+                'author_id',
+            ),
+        ))
+    tags, ingredients, *flags = await asyncio.gather(*lookups)
+    favorited, in_cart, followed = flags or (set(), set(), set())
+    snapshot = await catalogue_snapshot()
+    if any(
+        item.ingredient_id not in snapshot.ingredients
+        for items in ingredients.values() for item in items
+    ) or any(
+        item.tag_id not in snapshot.tags
+        for items in tags.values() for item in items
+    ):
+        raise FallbackError
+    for recipe in recipes:
+        recipe._prefetched_objects_cache = {
+            'recipe': ingredients.get(recipe.id, []),
+        }
+        recipe.tag_ids = [item.tag_id for item in tags.get(recipe.id, ())]
+        recipe.is_favorited = recipe.id in favorited
+        recipe.is_in_shopping_cart = recipe.id in in_cart
+        recipe.author_is_subscribed = recipe.author_id in followed
+    return recipes, snapshot
+
+
+async def filter_recipes(request):
+    """Фильтры RecipeFilter без поиска; ошибки отдаются синхронному пути."""
+    queryset = Recipe.objects.all()
+    slugs = set(request.GET.getlist('tags'))
+    if slugs:
+        known = (await catalogue_snapshot()).tag_ids
+        if not slugs <= known.keys():
+            raise FallbackError
+        tag_ids = [known[slug] for slug in slugs]
+        queryset = queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'), tag__in=tag_ids
+            )
+        ))
+    author = request.GET.get('author')
+    if author:
+        if not author.isdigit() or not await User.objects.filter(
+            pk=author
+        ).aexists():
+            raise FallbackError
+        queryset = queryset.filter(author_id=author)
+    user = request.user
+    if BOOLEANS.get(request.GET.get('is_favorited')) and user.is_authenticated:
+        queryset = queryset.filter(in_favorites__user=user)
+    if (
+        BOOLEANS.get(request.GET.get('is_in_shopping_cart'))
+        and user.is_authenticated
+    ):
+        queryset = queryset.filter(in_cart__user=user)
+    ordering = request.GET.get('ordering')
+    if not ordering:
+        return queryset
+    if ordering not in RECIPE_ORDERINGS:
+        raise FallbackError
+    return queryset.order_by(*RECIPE_ORDERINGS[ordering])
+
+
+def object_id(pk):
+    if not pk.isdigit():
+        raise FallbackError
+    return int(pk)
+
+
+def recipe_context(request, snapshot, image_variant='full'):
+    return {
+        'request': request,
+        'image_variant': image_variant,
+        'catalogue': snapshot,
+    }
+
+
+async def recipe_list(request):
+    queryset, links = await paginate(request, await filter_recipes(request))
+    recipes, snapshot = await load_recipes(queryset, request.user)
+    return json_response({**links, 'results': RecipeSerializer(
+        recipes, many=True, context=recipe_context(request, snapshot, 'card')
+    ).data})
+
+
+async def recipe_detail(request, pk):
+    recipes, snapshot = await load_recipes(
+        Recipe.objects.filter(pk=object_id(pk)), request.user
+    )
+    if not recipes:
+        raise FallbackError
+    return json_response(RecipeSerializer(
+        recipes[0], context=recipe_context(request, snapshot)
+    ).data)
+
+
+def catalogue_item(items, pk):
+    try:
+        return items[object_id(pk)]
+    except KeyError:
+        raise FallbackError
+
+
+async def tag_list(request):
+    snapshot = await catalogue_snapshot()
+    return json_response(TagSerializer(snapshot.tag_list, many=True).data)
+
+
+async def tag_detail(request, pk):
+    snapshot = await catalogue_snapshot()
+    return json_response(TagSerializer(
+        catalogue_item(snapshot.tags, pk)
+    ).data)
+
+
+async def ingredient_list(request):
+    name = request.GET.get('name')
+    if name:
+        return json_response(
+            await sync_to_async(ingredient_index.search)(name)
+        )
+    snapshot = await catalogue_snapshot()
+    if not snapshot.ingredients_loaded:
+        raise FallbackError
+    return json_response(
+        IngredientSerializer(snapshot.ingredient_list, many=True).data
+    )
+
+
+async def ingredient_detail(request, pk):
+    snapshot = await catalogue_snapshot()
+    return json_response(IngredientSerializer(
+        catalogue_item(snapshot.ingredients, pk)
+    ).data)
+
+
+async def subscriptions(request):
+    user = request.user
+    if user.is_anonymous:
+        raise FallbackError
+    queryset, links = await paginate(
+        request,
+        Follow.objects.filter(user=user).select_related('author')
+        .order_by('id'),
+    )
+    follows = [follow async for follow in queryset.aiterator()]
+    try:
+        limit = int(request.GET['recipes_limit'])
+    except (KeyError, ValueError):
+        limit = None
+    # limited_recipes компилирует подзапрос, поэтому строится в потоке.
+    recipes = await sync_to_async(limited_recipes)(
+        [follow.author_id for follow in follows], limit
+    )
+    by_author = await grouped(recipes, 'author_id')
+    for follow in follows:
+        follow.author.limited_recipes = by_author.get(follow.author_id, [])
+    return json_response({**links, 'results': UserFollowSerializer(
+        follows, many=True, context={'request': request}
+    ).data})
+
+
+HANDLERS = {
+    'recipes-list': (recipe_list, RECIPE_LIST_PARAMS, True),
+    'recipes-detail': (recipe_detail, (), True),
+    'tags-list': (tag_list, (), False),
+    'tags-detail': (tag_detail, (), False),
+    'ingredients-list': (ingredient_list, ('name',), False),
+    'ingredients-detail': (ingredient_detail, (), False),
+    'users-subscriptions': (subscriptions, SUBSCRIPTION_PARAMS, False),
+}
+
+
+def asyncify(patterns):
+    """Подменяет обработчики маршрутов роутера из HANDLERS."""
+    for pattern in patterns:
+        if pattern.name in HANDLERS:
+            handler, params, cached = HANDLERS[pattern.name]
+            pattern.callback = async_read_view(
+                handler, pattern.callback, params, cached
+            )
+    return patterns
@@ -0,0 +1,139 @@
+"""Аутентификация по JWT без обращения к базе на каждый запрос.
+
+Подпись и срок действия access-токена проверяются локально, а
+пользователь берётся из LRU-кэша процесса, который сбрасывается при
+сохранении User и ограничен по времени JWT_USER_CACHE_TTL, чтобы
+изменения из других процессов доходили без сигнала. Отозванные при
+выходе access-токены хранятся в компактном списке до истечения их
+срока; refresh-токены отзываются через token_blacklist simplejwt, общий
+для всех процессов.
+"""
+import copy
+import heapq
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic, time
+
+from django.conf import settings
+from rest_framework_simplejwt import authentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+
+class RevocationList:
+    """id отозванных токенов до истечения их срока.
+
+    jti хранится 16 байтами, истёкшие записи удаляются по куче сроков,
+    поэтому размер списка ограничен токенами, отозванными за время
+    жизни одного access-токена.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._revoked = {}
+        self._expiry = []
+
+    @staticmethod
+    def _key(jti):
+        try:
+            return bytes.fromhex(jti)
+        except ValueError:
+            return jti.encode()
+
+    def _prune(self, now):
+        while self._expiry and self._expiry[0][0] <= now:
+            _, key = heapq.heappop(self._expiry)
+            self._revoked.pop(key, None)
+
+    def revoke(self, jti, exp):
+        key = self._key(jti)
+        with self._lock:
+            self._prune(time())
+            if key not in self._revoked:
+                self._revoked[key] = exp
+                heapq.heappush(self._expiry, (exp, key))
+
+    def is_revoked(self, jti):
+        if not self._revoked:
+            return False
+        with self._lock:
+            self._prune(time())
+            return self._key(jti) in self._revoked
+
+
+class UserCache:
+    """LRU-кэш пользователей по id с ограничением по времени записи."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._users = OrderedDict()
+
+    def get(self, user_id):
+        with self._lock:
+            item = self._users.get(user_id)
+            if item is None:
+                return None
+            user, expires = item
+            if expires < monotonic():
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+        # Копия: представления могут менять request.user.
+        return copy.copy(user)
+
+    def set(self, user):
+        expires = monotonic() + settings.JWT_USER_CACHE_TTL
+        with self._lock:
+            self._users[user.pk] = (copy.copy(user), expires)
+            self._users.move_to_end(user.pk)
+            while len(self._users) > settings.JWT_USER_CACHE_SIZE:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+
+revoked_tokens = RevocationList()
+user_cache = UserCache()
+
+
+def revoke(token):
+    revoked_tokens.revoke(
+        token[api_settings.JTI_CLAIM], token['exp']
+    )
+
+
+def check_revoked(token):
+    if revoked_tokens.is_revoked(token[api_settings.JTI_CLAIM]):
+        raise InvalidToken('Токен отозван.')
+
+
+class JWTAuthentication(authentication.JWTAuthentication):
+    """Authorization: Bearer <access-токен>.
+
+    Значения Bearer, не похожие на JWT (например, токен сборщика
+    метрик), пропускаются, чтобы их проверили другие механизмы.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None or raw_token.count(b'.') != 2:
+            return None
+        token = self.get_validated_token(raw_token)
+        return self.get_user(token), token
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        check_revoked(token)
+        return token
+
+    def get_user(self, validated_token):
+        user = user_cache.get(validated_token.get(api_settings.USER_ID_CLAIM))
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user)
+        return user
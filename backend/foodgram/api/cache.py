@@ -0,0 +1,228 @@
+import hashlib
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+from time import monotonic
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.module_loading import import_string
+
+GLOBAL_SCOPE = 'global'
+LIST_SCOPE = 'recipes'
+
+
+def recipe_scope(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+class CacheStats:
+    fields = ('hits', 'misses', 'stores', 'evictions', 'not_modified')
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = dict.fromkeys(self.fields, 0)
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def as_dict(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+class LocalLRUBackend:
+    """Кэш в памяти процесса, ограниченный суммарным размером записей."""
+
+    def __init__(self, stats, max_bytes=32 * 1024 * 1024, timeout=60):
+        self.stats = stats
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._size = 0
+        self._lock = Lock()
+
+    def get_many(self, keys):
+        now = monotonic()
+        result = {}
+        with self._lock:
+            for key in keys:
+                item = self._data.get(key)
+                if item is None:
+                    continue
+                value, size, expires = item
+                if expires < now:
+                    self._pop(key)
+                    continue
+                self._data.move_to_end(key)
+                result[key] = value
+        return result
+
+    def get(self, key):
+        return self.get_many((key,)).get(key)
+
+    def set_many(self, values, timeout=None):
+        expires = monotonic() + (timeout or self.timeout)
+        with self._lock:
+            for key, value in values.items():
+                size = len(key) + (
+                    len(value[0]) if isinstance(value, tuple) else 64
+                )
+                self._pop(key)
+                self._data[key] = (value, size, expires)
+                self._size += size
+            while self._size > self.max_bytes and self._data:
+                self._pop(next(iter(self._data)))
+                self.stats.incr('evictions')
+
+    def set(self, key, value, timeout=None):
+        self.set_many({key: value}, timeout)
+
+    def _pop(self, key):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self._size -= item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+
+class DjangoCacheBackend:
+    """Хранит ответы в кэше Django (файловом, Redis и т.п.)."""
+
+    def __init__(self, stats, alias='default', timeout=60):
+        self.stats = stats
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def get_many(self, keys):
+        return self.cache.get_many(keys)
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set_many(self, values, timeout=None):
+        self.cache.set_many(values, timeout or self.timeout)
+
+    def set(self, key, value, timeout=None):
+        self.cache.set(key, value, timeout or self.timeout)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.stats = backend.stats
+
+    def versions(self, scopes):
+        keys = [f'version:{scope}' for scope in scopes]
+        found = self.backend.get_many(keys)
+        missing = {key: uuid4().hex for key in keys if key not in found}
+        if missing:
+            self.backend.set_many(
+                missing, settings.RESPONSE_CACHE['VERSION_TIMEOUT']
+            )
+        return [found.get(key) or missing[key] for key in keys]
+
+    def bump(self, scopes):
+        self.backend.set_many(
+            {f'version:{scope}': uuid4().hex for scope in scopes},
+            settings.RESPONSE_CACHE['VERSION_TIMEOUT'],
+        )
+
+    def make_key(self, request, scopes):
+        query = sorted(
+            (name, value)
+            for name, values in request.GET.lists()
+            for value in values
+        )
+        raw = '|'.join((
+            request.path,
+            repr(query),
+            request.META.get('HTTP_ACCEPT', ''),
+            *self.versions(scopes),
+        ))
+        return 'response:' + hashlib.md5(raw.encode()).hexdigest()
+
+    def get(self, request, key):
+        entry = self.backend.get(key)
+        if entry is None:
+            self.stats.incr('misses')
+            return None
+        self.stats.incr('hits')
+        content, content_type, etag = entry
+        if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            self.stats.incr('not_modified')
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        response['X-Cache'] = 'HIT'
+        return response
+
+    def store(self, key, response):
+        response.render()
+        etag = f'"{hashlib.md5(response.content).hexdigest()}"'
+        self.backend.set(
+            key, (response.content, response['Content-Type'], etag)
+        )
+        self.stats.incr('stores')
+        response['ETag'] = etag
+        response['X-Cache'] = 'MISS'
+
+
+@lru_cache(maxsize=None)
+def get_response_cache():
+    config = settings.RESPONSE_CACHE
+    backend = import_string(config['BACKEND'])(
+        CacheStats(), timeout=config['TIMEOUT'], **config['OPTIONS']
+    )
+    return ResponseCache(backend)
+
+
+class CachedResponseMixin:
+    """Кэширует ответы анонимным пользователям для cached_actions.
+
+    Ключ строится из пути, отсортированной строки запроса, заголовка
+    Accept и версий областей, которые сбрасываются сигналами при
+    изменении данных.
+    """
+    cached_actions = ('list', 'retrieve')
+
+    def get_cache_scopes(self, action, kwargs):
+        scopes = [GLOBAL_SCOPE]
+        if action == 'list':
+            scopes.append(LIST_SCOPE)
+        elif self.lookup_field in kwargs:
+            scopes.append(recipe_scope(kwargs[self.lookup_field]))
+        return scopes
+
+    def dispatch(self, request, *args, **kwargs):
+        action = getattr(self, 'action_map', {}).get(request.method.lower())
+        if (
+            not settings.RESPONSE_CACHE['ENABLED']
+            or action not in self.cached_actions
+            or 'HTTP_AUTHORIZATION' in request.META
+        ):
+            return super().dispatch(request, *args, **kwargs)
+
+        cache = get_response_cache()
+        key = cache.make_key(request, self.get_cache_scopes(action, kwargs))
+        response = cache.get(request, key)
+        if response is not None:
+            return response
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.store(key, response)
+        return response
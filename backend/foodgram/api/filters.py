@@ -1,6 +1,20 @@
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes import search
+from recipes.catalogue import catalogue
+from recipes.models import Recipe
+
+RECIPE_ORDERINGS = {
+    'newest': ('-pub_date', '-id'),
+    'popular': ('-favorites_count', '-id'),
+    'trending': ('-trending_score', '-id'),
+    'cooking_time': ('cooking_time', 'id'),
+}
+
+
+def tag_choices():
+    return [(tag.slug, tag.name) for tag in catalogue.get().tag_list]
 
 
 class RecipeFilter(FilterSet):
@@ -8,16 +22,37 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart'
     )
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices,
+        method='filter_tags',
+    )
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+        method='filter_ordering',
     )
 
     class Meta:
         model = Recipe
         fields = ('tags', 'author',)
 
+    def filter_tags(self, queryset, name, slugs):
+        if not slugs:
+            return queryset
+        tag_ids = catalogue.get().tag_ids
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe=OuterRef('pk'),
+            tag__in=[tag_ids[slug] for slug in slugs if slug in tag_ids],
+        )))
+
+    def filter_search(self, queryset, name, value):
+        if not value.strip():
+            return queryset
+        return search.search(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
+
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
         if value and not user.is_anonymous:
@@ -29,11 +64,3 @@ class RecipeFilter(FilterSet):
         if value and not user.is_anonymous:
             return queryset.filter(in_cart__user=user)
         return queryset
-
-
-class IngredientFilter(FilterSet):
-    name = filters.CharFilter(lookup_expr='startswith')
-
-    class Meta:
-        model = Ingredient
-        fields = ('name',)
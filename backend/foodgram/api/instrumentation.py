@@ -0,0 +1,363 @@
+"""Замеры запросов к API: SQL, сериализация, размер ответа.
+
+Для выбранной доли запросов (INSTRUMENTATION['SAMPLE_RATE']) обёртка
+курсора считает запросы, время в базе и повторы одного и того же SQL с
+разными параметрами (признак N+1). Итоги уходят в заголовок
+Server-Timing, в журнал api.instrumentation одной JSON-строкой и в
+счётчики процесса, которые отдаются в текстовом формате Prometheus.
+Остальные запросы только учитываются в счётчиках по времени ответа.
+"""
+import json
+import logging
+import random
+import re
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from threading import Lock
+from time import perf_counter
+
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+logger = logging.getLogger('api.instrumentation')
+
+current = ContextVar('request_metrics', default=None)
+
+PLACEHOLDER_LIST = re.compile(r'%s(?:\s*,\s*%s)+')
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+TOP_DUPLICATES = 3
+
+
+def fingerprint(sql):
+    """SQL без различий в длине списков параметров IN (...)."""
+    return PLACEHOLDER_LIST.sub('%s, ...', sql)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.fingerprints = {}
+        self.timings = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += perf_counter() - started
+            self.queries += 1
+            key = fingerprint(sql)
+            self.fingerprints[key] = self.fingerprints.get(key, 0) + 1
+
+    @contextmanager
+    def measure(self, name):
+        started, queries = perf_counter(), self.queries
+        try:
+            yield
+        finally:
+            duration, count = self.timings.get(name, (0.0, 0))
+            self.timings[name] = (
+                duration + perf_counter() - started,
+                count + self.queries - queries,
+            )
+
+    def duplicates(self):
+        repeated = sorted(
+            (
+                (count, sql) for sql, count in self.fingerprints.items()
+                if count > 1
+            ),
+            reverse=True,
+        )
+        return sum(count - 1 for count, _ in repeated), repeated
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(DURATION_BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.buckets[bisect_left(DURATION_BUCKETS, value)] += 1
+        self.sum += value
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip((*DURATION_BUCKETS, '+Inf'), self.buckets):
+            total += count
+            yield bound, total
+
+
+class MetricsRegistry:
+    """Счётчики процесса в разрезе представления, метода и статуса."""
+
+    sampled_fields = (
+        ('db_queries', 'Запросов к базе в замеренных ответах.'),
+        ('db_duplicate_queries', 'Повторных запросов с тем же SQL.'),
+        ('db_seconds', 'Время в базе в замеренных ответах.'),
+        ('serializer_seconds', 'Время сериализации в замеренных ответах.'),
+        ('response_bytes', 'Размер замеренных ответов.'),
+        ('sampled_requests', 'Замеренных ответов.'),
+    )
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}
+            self.durations = {}
+            self.sampled = {}
+            self.shed_requests = {}
+
+    def observe(self, view, method, status, duration, values=None):
+        labels = (view, method, str(status))
+        with self._lock:
+            self.requests[labels] = self.requests.get(labels, 0) + 1
+            self.durations.setdefault(view, Histogram()).observe(duration)
+            if values is None:
+                return
+            totals = self.sampled.setdefault(view, {})
+            for name, value in values.items():
+                totals[name] = totals.get(name, 0) + value
+
+    def shed(self, view, reason):
+        """Учитывает запрос, отклонённый ограничениями нагрузки."""
+        labels = (view, reason)
+        with self._lock:
+            self.shed_requests[labels] = self.shed_requests.get(labels, 0) + 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines.extend(self._header(
+                'requests', 'counter', 'Ответов API.'
+            ))
+            for (view, method, status), count in sorted(
+                self.requests.items()
+            ):
+                labels = format_labels(
+                    view=view, method=method, status=status
+                )
+                lines.append(f'foodgram_requests_total{labels} {count}')
+            lines.extend(self._header(
+                'shed_requests', 'counter',
+                'Запросов, отклонённых ограничениями нагрузки.'
+            ))
+            for (view, reason), count in sorted(self.shed_requests.items()):
+                labels = format_labels(view=view, reason=reason)
+                lines.append(f'foodgram_shed_requests_total{labels} {count}')
+            lines.extend(self._header(
+                'request_duration_seconds', 'histogram',
+                'Время ответа API.'
+            ))
+            for view, histogram in sorted(self.durations.items()):
+                for bound, total in histogram.cumulative():
+                    labels = format_labels(view=view, le=bound)
+                    lines.append(
+                        'foodgram_request_duration_seconds_bucket'
+                        f'{labels} {total}'
+                    )
+                labels = format_labels(view=view)
+                lines.append(
+                    f'foodgram_request_duration_seconds_sum{labels} '
+                    f'{histogram.sum:.6f}'
+                )
+                lines.append(
+                    f'foodgram_request_duration_seconds_count{labels} '
+                    f'{total}'
+                )
+            for name, description in self.sampled_fields:
+                lines.extend(self._header(name, 'counter', description))
+                for view, totals in sorted(self.sampled.items()):
+                    lines.append(
+                        f'foodgram_{name}_total{format_labels(view=view)} '
+                        f'{totals.get(name, 0):g}'
+                    )
+        return '\n'.join(lines) + '\n'
+
+    def _header(self, name, kind, description):
+        suffix = '_total' if kind == 'counter' else ''
+        return (
+            f'# HELP foodgram_{name}{suffix} {description}',
+            f'# TYPE foodgram_{name}{suffix} {kind}',
+        )
+
+
+def format_labels(**labels):
+    values = ','.join(
+        f'{name}="{escape_label(value)}"' for name, value in labels.items()
+    )
+    return f'{{{values}}}'
+
+
+def escape_label(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n'
+    )
+
+
+@lru_cache(maxsize=None)
+def get_registry():
+    return MetricsRegistry()
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match.url_name or 'unresolved'
+
+
+def server_timing(metrics, duration):
+    entries = []
+    if metrics is not None:
+        duplicated, _ = metrics.duplicates()
+        entries.append(
+            f'db;dur={metrics.db_time * 1000:.1f};'
+            f'desc="{metrics.queries} queries, {duplicated} duplicated"'
+        )
+        for name, (spent, _) in metrics.timings.items():
+            entries.append(f'{name};dur={spent * 1000:.1f}')
+    entries.append(f'total;dur={duration * 1000:.1f}')
+    return ', '.join(entries)
+
+
+def response_size(response):
+    if response.streaming:
+        return None
+    return len(response.content)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install(connection):
+    """Ставит на соединение обёртку, которая пишет в замер запроса.
+
+    Замер ищется в контекстной переменной, поэтому запросы учитываются
+    и в потоках sync_to_async, куда асинхронный ORM выносит работу с
+    базой.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class InstrumentationMiddleware(MiddlewareMixin):
+    """Замеряет ответы API; см. настройку INSTRUMENTATION."""
+
+    def __call__(self, request):
+        if self._is_coroutine:
+            return self.__acall__(request)
+        if not settings.INSTRUMENTATION['ENABLED']:
+            return self.get_response(request)
+        token, started = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics = current.get()
+            current.reset(token)
+        return self.finish(request, response, metrics, started)
+
+    async def __acall__(self, request):
+        if not settings.INSTRUMENTATION['ENABLED']:
+            return await self.get_response(request)
+        token, started = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics = current.get()
+            current.reset(token)
+        return self.finish(request, response, metrics, started)
+
+    def start(self):
+        metrics = None
+        if random.random() < settings.INSTRUMENTATION['SAMPLE_RATE']:
+            metrics = RequestMetrics()
+        return current.set(metrics), perf_counter()
+
+    def finish(self, request, response, metrics, started):
+        duration = perf_counter() - started
+        view = view_name(request)
+        values = None
+        if metrics is not None:
+            values = self.record(request, response, metrics, view, duration)
+        get_registry().observe(
+            view, request.method, response.status_code, duration, values
+        )
+        if settings.INSTRUMENTATION['SERVER_TIMING']:
+            response['Server-Timing'] = server_timing(metrics, duration)
+        return response
+
+    def record(self, request, response, metrics, view, duration):
+        duplicated, repeated = metrics.duplicates()
+        serializer_time, serializer_queries = metrics.timings.get(
+            'serializer', (0.0, 0)
+        )
+        size = response_size(response)
+        logger.info(json.dumps({
+            'view': view,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'db_queries': metrics.queries,
+            'db_ms': round(metrics.db_time * 1000, 2),
+            'db_duplicate_queries': duplicated,
+            'db_duplicates': [
+                {'count': count, 'sql': sql[:200]}
+                for count, sql in repeated[:TOP_DUPLICATES]
+            ],
+            'serializer_ms': round(serializer_time * 1000, 2),
+            'serializer_queries': serializer_queries,
+            'response_bytes': size,
+        }, ensure_ascii=False))
+        return {
+            'db_queries': metrics.queries,
+            'db_duplicate_queries': duplicated,
+            'db_seconds': metrics.db_time,
+            'serializer_seconds': serializer_time,
+            'response_bytes': size or 0,
+            'sampled_requests': 1,
+        }
+
+
+@lru_cache(maxsize=None)
+def timed_serializer_class(serializer_class):
+    """Подкласс сериализатора, замеряющий построение data."""
+
+    class TimedSerializer(serializer_class):
+        @property
+        def data(self):
+            metrics = current.get()
+            if metrics is None:
+                return super().data
+            with metrics.measure('serializer'):
+                return super().data
+
+    TimedSerializer.__name__ = serializer_class.__name__
+    TimedSerializer.__qualname__ = serializer_class.__qualname__
+    return TimedSerializer
+
+
+class InstrumentedViewMixin:
+    """Замеряет сериализаторы, полученные через get_serializer.
+
+    Время и число запросов к базе, сделанных при построении data,
+    попадают в замер как serializer: рост запросов здесь обычно означает
+    N+1 в полях сериализатора.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if current.get() is not None:
+            serializer.__class__ = timed_serializer_class(type(serializer))
+        return serializer
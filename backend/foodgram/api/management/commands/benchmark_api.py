@@ -0,0 +1,234 @@
+import json
+import time
+import tracemalloc
+from io import StringIO
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from rest_framework.authtoken.models import Token
+from rest_framework_simplejwt.tokens import AccessToken
+
+from recipes import counters, feed
+from recipes.models import Ingredient, Recipe
+from users.models import Follow, User
+
+BASELINE = settings.BASE_DIR / 'data' / 'benchmark_baseline.json'
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет основные эндпоинты API на синтетических данных и '
+        'сравнивает число запросов, задержку и память с эталоном.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--follows', type=int, default=10)
+        parser.add_argument(
+            '--subscriptions', type=int, default=500,
+            help='Подписок у пользователя, от имени которого идут запросы.'
+        )
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--auth', choices=('jwt', 'token'), default='jwt',
+            help='Схема аутентификации пользователя в сценариях.'
+        )
+        parser.add_argument('--baseline', default=str(BASELINE))
+        parser.add_argument(
+            '--update-baseline', action='store_true',
+            help='Перезаписать эталон текущими результатами.'
+        )
+        parser.add_argument(
+            '--max-slowdown', type=float, default=None,
+            help='Допустимый рост p95 относительно эталона, например 1.5.'
+        )
+
+    def handle(self, *args, **options):
+        # Замеряется обработка запросов, а не ограничения частоты.
+        settings.THROTTLING = {**settings.THROTTLING, 'ENABLED': False}
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            call_command(
+                'seed_data',
+                users=max(options['users'], options['subscriptions'] + 1),
+                recipes=options['recipes'], follows=options['follows'],
+                stdout=StringIO()
+            )
+            self.seed_subscriptions(options['subscriptions'])
+            results = self.run_scenarios(options['repeat'], options['auth'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['update_baseline']:
+            with open(options['baseline'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+                file.write('\n')
+            self.report(results, {})
+            return
+        try:
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)
+        except FileNotFoundError:
+            baseline = {}
+        failures = self.report(results, baseline, options['max_slowdown'])
+        if failures:
+            raise CommandError('Регрессия: ' + ', '.join(failures))
+
+    def seed_subscriptions(self, count):
+        """Подписывает пользователя сценариев на count авторов."""
+        user = User.objects.order_by('id').first()
+        Follow.objects.bulk_create(
+            (
+                Follow(user=user, author=author)
+                for author in User.objects.exclude(id=user.id)[:count]
+            ),
+            ignore_conflicts=True,
+        )
+        counters.rebuild()
+        feed.rebuild()
+
+    def scenarios(self):
+        user = User.objects.order_by('id').first()
+        last_page = max(1, -(
+            -Follow.objects.filter(user=user).count()
+            // settings.MAX_PAGE_SIZE
+        ))
+        recipe = Recipe.objects.order_by('id').first()
+        ingredient = Ingredient.objects.order_by('id').first().name
+        prefix = ingredient[:2]
+        word = quote(ingredient.split()[0])
+        have = '&'.join(
+            f'ingredients={item.ingredient_id}'
+            for item in recipe.recipe.all()[:5]
+        )
+        return {
+            'recipes_list': '/api/recipes/?limit=6',
+            'recipes_list_cursor': '/api/recipes/?cursor=&limit=6',
+            'recipes_list_trending': (
+                '/api/recipes/?ordering=trending&cursor=&limit=6'
+            ),
+            'recipes_search': f'/api/recipes/?search={word}&limit=6',
+            'recipes_match': f'/api/recipes/match/?{have}&missing=3',
+            'recipes_feed': '/api/recipes/feed/?limit=6',
+            'recipe_detail': f'/api/recipes/{recipe.id}/',
+            'recipes_list_anonymous': '/api/recipes/?limit=6',
+            'recipe_detail_anonymous': f'/api/recipes/{recipe.id}/',
+            'subscriptions': (
+                '/api/users/subscriptions/?limit=6&recipes_limit=3'
+            ),
+            'subscriptions_last_page': (
+                f'/api/users/subscriptions/?limit={settings.MAX_PAGE_SIZE}'
+                f'&page={last_page}&recipes_limit=3'
+            ),
+            'ingredients_search': f'/api/ingredients/?name={quote(prefix)}',
+            'download_shopping_cart': '/api/recipes/download_shopping_cart/',
+            'download_shopping_cart_csv': (
+                '/api/recipes/download_shopping_cart/?format=csv'
+            ),
+            'download_shopping_cart_pdf': (
+                '/api/recipes/download_shopping_cart/?format=pdf'
+            ),
+        }
+
+    def get_client(self, auth):
+        user = User.objects.order_by('id').first()
+        if auth == 'jwt':
+            return Client(
+                HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}'
+            )
+        token, _ = Token.objects.get_or_create(user=user)
+        return Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def run_scenarios(self, repeat, auth):
+        client = self.get_client(auth)
+        anonymous = Client()
+        return {
+            name: self.measure(
+                anonymous if name.endswith('_anonymous') else client,
+                path, repeat
+            )
+            for name, path in self.scenarios().items()
+        }
+
+    def fetch(self, client, path):
+        """Возвращает время до первого байта, полное время в мс и размер."""
+        start = time.perf_counter()
+        response = client.get(path)
+        if response.status_code != 200:
+            raise CommandError(f'{path} вернул {response.status_code}')
+        if not response.streaming:
+            elapsed = (time.perf_counter() - start) * 1000
+            return elapsed, elapsed, len(response.content)
+        chunks = iter(response.streaming_content)
+        size = len(next(chunks, b''))
+        first_byte = (time.perf_counter() - start) * 1000
+        for chunk in chunks:
+            size += len(chunk)
+        return first_byte, (time.perf_counter() - start) * 1000, size
+
+    def measure(self, client, path, repeat):
+        self.fetch(client, path)
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            *_, size = self.fetch(client, path)
+
+        tracemalloc.start()
+        self.fetch(client, path)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        first_bytes, timings, _ = zip(*(
+            self.fetch(client, path) for _ in range(repeat)
+        ))
+        return {
+            'queries': queries.count,
+            'bytes': size,
+            'first_byte_ms': round(percentile(first_bytes, 0.5), 3),
+            'p50_ms': round(percentile(timings, 0.5), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'memory_kb': round(peak / 1024, 1),
+        }
+
+    def report(self, results, baseline, max_slowdown=None):
+        failures = []
+        for name, result in results.items():
+            expected = baseline.get(name, {})
+            line = (
+                f'{name:<28} queries={result["queries"]:<4} '
+                f'p50={result["p50_ms"]:.2f}ms p95={result["p95_ms"]:.2f}ms '
+                f'ttfb={result["first_byte_ms"]:.2f}ms '
+                f'memory={result["memory_kb"]:.0f}KB bytes={result["bytes"]}'
+            )
+            if 'queries' in expected:
+                line += f' (эталон: {expected["queries"]} запросов)'
+                if result['queries'] > expected['queries']:
+                    failures.append(f'{name}: запросов')
+            if (
+                max_slowdown and 'p95_ms' in expected
+                and result['p95_ms'] > expected['p95_ms'] * max_slowdown
+            ):
+                failures.append(f'{name}: p95')
+            self.stdout.write(line)
+        return failures
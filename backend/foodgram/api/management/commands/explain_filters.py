@@ -0,0 +1,167 @@
+import json
+import re
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from api.views import RecipeViewSet
+from recipes.models import Ingredient, Recipe
+from users.models import User
+
+BASELINE = settings.BASE_DIR / 'data' / 'explain_baseline.json'
+SCAN_PATTERNS = {
+    'postgresql': re.compile(
+        r'(?P<kind>Seq Scan|Index Only Scan|Index Scan|Bitmap Heap Scan)'
+        r'(?: using (?P<index>\S+))? on (?P<table>\S+)'
+    ),
+    'sqlite': re.compile(
+        r'\b(?P<kind>SCAN|SEARCH) (?P<table>\S+)'
+        r'(?: AS \S+)?(?: USING (?:COVERING |INTEGER PRIMARY KEY)?'
+        r'(?:INDEX (?P<index>\S+))?)?'
+    ),
+}
+FULL_SCANS = ('Seq Scan', 'SCAN')
+EXECUTION_TIME = re.compile(r'Execution Time: ([\d.]+) ms')
+
+
+def plan_scans(plan, vendor):
+    """Сводит план к набору обращений к таблицам: full или индекс."""
+    pattern = SCAN_PATTERNS.get(vendor)
+    if pattern is None:
+        return []
+    scans = set()
+    for match in pattern.finditer(plan):
+        if match['kind'] in FULL_SCANS and not match['index']:
+            scans.add(f'full:{match["table"]}')
+        else:
+            scans.add(f'index:{match["table"]}:{match["index"] or "pk"}')
+    return sorted(scans)
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит планы запросов списка рецептов для типовых сочетаний '
+        'фильтров и сравнивает их с эталоном.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--baseline', default=str(BASELINE))
+        parser.add_argument(
+            '--update-baseline', action='store_true',
+            help='Перезаписать эталон текущими планами.'
+        )
+        parser.add_argument(
+            '--show-plans', action='store_true',
+            help='Печатать планы целиком.'
+        )
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            call_command(
+                'seed_data', users=options['users'],
+                recipes=options['recipes'], stdout=StringIO()
+            )
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            results = self.explain_all(options['show_plans'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        try:
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)
+        except FileNotFoundError:
+            baseline = {}
+        if options['update_baseline']:
+            baseline[vendor] = {
+                name: result['scans'] for name, result in results.items()
+            }
+            with open(options['baseline'], 'w', encoding='utf-8') as file:
+                json.dump(baseline, file, indent=2, sort_keys=True)
+                file.write('\n')
+            self.report(results, {})
+            return
+        failures = self.report(results, baseline.get(vendor, {}))
+        if failures:
+            raise CommandError('Регрессия планов: ' + ', '.join(failures))
+
+    def scenarios(self):
+        author = Recipe.objects.order_by('id').first().author_id
+        word = Ingredient.objects.order_by('id').first().name.split()[0]
+        return {
+            'no_filters': {},
+            'tags': {'tags': ['breakfast']},
+            'tags_multiple': {'tags': ['breakfast', 'lunch', 'dinner']},
+            'author': {'author': author},
+            'author_tags': {'author': author, 'tags': ['lunch']},
+            'favorited': {'is_favorited': 1},
+            'favorited_tags': {'is_favorited': 1, 'tags': ['dinner']},
+            'in_cart': {'is_in_shopping_cart': 1},
+            'in_cart_tags': {'is_in_shopping_cart': 1, 'tags': ['breakfast']},
+            'popular': {'ordering': 'popular'},
+            'trending': {'ordering': 'trending'},
+            'cooking_time': {'ordering': 'cooking_time'},
+            'trending_tags': {'ordering': 'trending', 'tags': ['lunch']},
+            'search': {'search': word},
+            'search_tags': {'search': word, 'tags': ['dinner']},
+        }
+
+    def build_queryset(self, user, params):
+        request = Request(RequestFactory().get('/api/recipes/', params))
+        request.user = user
+        view = RecipeViewSet(
+            request=request, action='list', format_kwarg=None,
+            args=(), kwargs={}
+        )
+        queryset = view.filter_queryset(view.get_queryset())
+        return queryset[:settings.DEFAULT_PAGE_SIZE]
+
+    def explain_all(self, show_plans):
+        user = User.objects.order_by('id').first()
+        options = {}
+        if connection.vendor == 'postgresql':
+            options['analyze'] = True
+        results = {}
+        for name, params in self.scenarios().items():
+            plan = self.build_queryset(user, params).explain(**options)
+            if show_plans:
+                self.stdout.write(f'--- {name}\n{plan}')
+            timing = EXECUTION_TIME.search(plan)
+            results[name] = {
+                'scans': plan_scans(plan, connection.vendor),
+                'ms': float(timing[1]) if timing else None,
+            }
+        return results
+
+    def report(self, results, baseline):
+        failures = []
+        for name, result in results.items():
+            line = f'{name:<16}'
+            if result['ms'] is not None:
+                line += f' {result["ms"]:.2f}ms'
+            line += ' ' + ' '.join(result['scans'])
+            expected = baseline.get(name)
+            if expected is not None:
+                new_full = [
+                    scan for scan in result['scans']
+                    if scan.startswith('full:') and scan not in expected
+                ]
+                if new_full:
+                    failures.append(name)
+                    line += ' (новые полные просмотры: '
+                    line += ', '.join(new_full) + ')'
+                elif result['scans'] != expected:
+                    line += ' (план изменился)'
+            self.stdout.write(line)
+        return failures
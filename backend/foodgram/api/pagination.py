@@ -1,5 +1,156 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from recipes import feed
+from recipes.models import Recipe
 
 
 class PageLimitPagination(PageNumberPagination):
+    """Постраничная навигация ?page=&limit= с курсорным режимом ?cursor=.
+
+    Курсорный режим включается для представлений с атрибутом
+    cursor_ordering, если страница нарезается из QuerySet: выборка идёт
+    по ключу сортировки без OFFSET и без подсчёта COUNT(*). Явный
+    order_by запроса, например из фильтра ?ordering=, имеет приоритет
+    над cursor_ordering.
+    """
+    page_size = settings.DEFAULT_PAGE_SIZE
     page_size_query_param = 'limit'
+    max_page_size = settings.MAX_PAGE_SIZE
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Некорректный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = getattr(view, 'cursor_ordering', None)
+        if (
+            self.cursor_query_param not in request.query_params
+            or not isinstance(queryset, QuerySet)
+        ):
+            self.ordering = None
+        if self.ordering is None:
+            return super().paginate_queryset(queryset, request, view)
+        self.ordering = tuple(queryset.query.order_by) or self.ordering
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        values, reverse = self.decode_cursor(queryset.model)
+        ordering = self.ordering
+        if reverse:
+            ordering = [self.invert(field) for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.keyset_filter(ordering, values))
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+        has_next = has_more if not reverse else values is not None
+        has_previous = has_more if reverse else values is not None
+        self.next_cursor = (
+            self.encode_cursor(results[-1], False)
+            if has_next and results else None
+        )
+        self.previous_cursor = (
+            self.encode_cursor(results[0], True)
+            if has_previous and results else None
+        )
+        return results
+
+    def get_paginated_response(self, data):
+        if self.ordering is None:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.cursor_link(self.next_cursor),
+            'previous': self.cursor_link(self.previous_cursor),
+            'results': data,
+        })
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def keyset_filter(ordering, values):
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def encode_cursor(self, obj, reverse):
+        values = [
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in (
+                getattr(obj, field.lstrip('-')) for field in self.ordering
+            )
+        ]
+        payload = json.dumps({'v': values, 'r': reverse})
+        return urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, model):
+        cursor = self.request.query_params[self.cursor_query_param]
+        if not cursor:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(cursor.encode()))
+            values = [
+                self.parse_value(model, field.lstrip('-'), value)
+                for field, value in zip(self.ordering, payload['v'])
+            ]
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return values, bool(payload['r'])
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def parse_value(model, name, value):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return value
+        return field.to_python(value)
+
+    def cursor_link(self, cursor):
+        if cursor is None:
+            return None
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param
+        )
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+
+class FeedPagination(PageLimitPagination):
+    """Курсорная навигация по ленте подписок: только вперёд, без COUNT(*).
+
+    Курсор — (pub_date, id) последнего рецепта страницы, как у
+    PageLimitPagination, поэтому ссылки и ошибки у них одинаковые.
+    """
+    ordering = ('-pub_date', '-id')
+
+    def paginate_timeline(self, user, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        cursor = None
+        if request.query_params.get(self.cursor_query_param):
+            cursor, _ = self.decode_cursor(Recipe)
+        entries = feed.timeline(user, self.page_size + 1, cursor)
+        self.next_cursor = None
+        self.previous_cursor = None
+        if len(entries) > self.page_size:
+            entries = entries[:self.page_size]
+            self.next_cursor = self.encode_cursor(entries[-1], False)
+        return entries
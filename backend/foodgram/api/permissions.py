@@ -1,3 +1,6 @@
+from hmac import compare_digest
+
+from django.conf import settings
 from rest_framework.permissions import SAFE_METHODS, BasePermission
 
 
@@ -22,3 +25,18 @@ class AdminOrReadOnly(BasePermission):
             and request.user.is_active
             and request.user.is_staff
         )
+
+
+class MetricsAccess(BasePermission):
+    """Администратор или сборщик метрик с INSTRUMENTATION['METRICS_TOKEN'].
+
+    Токен передаётся в заголовке Authorization: Bearer <токен>.
+    """
+
+    def has_permission(self, request, view):
+        token = settings.INSTRUMENTATION['METRICS_TOKEN']
+        if token and compare_digest(
+            request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'
+        ):
+            return True
+        return request.user.is_authenticated and request.user.is_staff
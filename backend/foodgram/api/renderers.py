@@ -0,0 +1,153 @@
+import csv
+from io import BytesIO
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+PDF_CHUNK_SIZE = 64 * 1024
+
+by_unit = itemgetter('ingredient__measurement_unit')
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Выгрузка списка покупок текстом.
+
+    stream() получает строки, отсортированные по единице измерения и
+    названию, и отдаёт файл частями для StreamingHttpResponse. Потомки
+    для других форматов переопределяют его вместе с media_type и format.
+    Через render() проходят только ответы с ошибками: они отдаются в JSON,
+    как и остальные ответы API.
+    """
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = JSONRenderer.media_type
+        return JSONRenderer().render(data)
+
+    def get_content_type(self):
+        if self.charset:
+            return f'{self.media_type}; charset={self.charset}'
+        return self.media_type
+
+    def get_filename(self, user):
+        return f'{user.username}_shopping_list.{self.format}'
+
+    def stream(self, rows, user, today):
+        yield (
+            f'Список покупок для: {user.get_full_name()}\n\n'
+            f'Дата: {today:%Y-%m-%d}\n'
+        )
+        for unit, group in groupby(rows, key=by_unit):
+            yield f'\n{unit}:\n'
+            for row in group:
+                yield f'- {row["ingredient__name"]} - {row["amount"]}\n'
+        yield f'\nFoodgram ({today:%Y})'
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows, user, today):
+        writer = csv.writer(Echo())
+        yield '\ufeff' + writer.writerow(
+            ('Ингредиент', 'Единица измерения', 'Количество')
+        )
+        for row in rows:
+            yield writer.writerow((
+                row['ingredient__name'],
+                row['ingredient__measurement_unit'],
+                row['amount'],
+            ))
+
+
+class PDFShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    font_name = 'ShoppingListFont'
+    font_size = 11
+    line_height = 16
+    margin = 50
+
+    def get_font(self):
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+
+        try:
+            pdfmetrics.getFont(self.font_name)
+        except KeyError:
+            try:
+                pdfmetrics.registerFont(
+                    TTFont(self.font_name, settings.SHOPPING_LIST_PDF_FONT)
+                )
+            except OSError:
+                return 'Helvetica'
+        return self.font_name
+
+    def stream(self, rows, user, today):
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen.canvas import Canvas
+
+        buffer = BytesIO()
+        canvas = Canvas(buffer, pagesize=A4)
+        font = self.get_font()
+        _, height = A4
+        y = height - self.margin
+
+        def write(text, indent=0):
+            nonlocal y
+            if y < self.margin:
+                canvas.showPage()
+                y = height - self.margin
+            canvas.setFont(font, self.font_size)
+            canvas.drawString(self.margin + indent, y, text)
+            y -= self.line_height
+
+        write(f'Список покупок для: {user.get_full_name()}')
+        write(f'Дата: {today:%Y-%m-%d}')
+        for unit, group in groupby(rows, key=by_unit):
+            y -= self.line_height / 2
+            write(f'{unit}:')
+            for row in group:
+                write(
+                    f'- {row["ingredient__name"]} - {row["amount"]}',
+                    indent=15
+                )
+        y -= self.line_height / 2
+        write(f'Foodgram ({today:%Y})')
+        canvas.save()
+
+        buffer.seek(0)
+        yield from iter(lambda: buffer.read(PDF_CHUNK_SIZE), b'')
+
+
+SHOPPING_LIST_RENDERERS = (
+    ShoppingListRenderer,
+    CSVShoppingListRenderer,
+    PDFShoppingListRenderer,
+)
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = f'{data.get("detail", "")}\n'
+        return data.encode(self.charset)
@@ -1,18 +1,90 @@
-from django.shortcuts import get_object_or_404
-from drf_extra_fields.fields import Base64ImageField
+import base64
+import binascii
+from functools import cached_property
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Manager, prefetch_related_objects
 from rest_framework.exceptions import ValidationError
-from rest_framework.serializers import (CharField, EmailField,
-                                        IntegerField, ModelSerializer,
-                                        PrimaryKeyRelatedField, ReadOnlyField,
+from rest_framework.serializers import (CharField, ChoiceField, EmailField,
+                                        Field, IntegerField, ListField,
+                                        ListSerializer, ModelSerializer,
+                                        ReadOnlyField, Serializer,
                                         SerializerMethodField)
 from rest_framework.status import HTTP_400_BAD_REQUEST
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import RefreshToken
 
+from recipes import bulk, images, shopping_list
+from recipes.catalogue import catalogue
+from recipes.matching import MODES
 from recipes.models import (Cart, Favorites, Ingredient, Recipe,
                             RecipeIngredient, Tag)
 from users.models import Follow, User
 
 
-class ShortRecipeSerializer(ModelSerializer):
+class RecipeImageMixin:
+    image_variant = 'full'
+
+    def build_url(self, name):
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def current_variants(self, recipe):
+        """Превью текущего изображения; прежнего — не отдаются."""
+        variants = recipe.image_variants
+        if variants.get('source') != recipe.image.name:
+            return {}
+        return variants
+
+    def get_image(self, recipe):
+        variant = self.context.get('image_variant', self.image_variant)
+        name = self.current_variants(recipe).get(variant, {}).get('webp')
+        return self.build_url(name or recipe.image.name)
+
+    def get_image_variants(self, recipe):
+        return {
+            variant: {
+                extension: self.build_url(name)
+                for extension, name in formats.items()
+            }
+            for variant, formats in images.variant_formats(
+                self.current_variants(recipe)
+            ).items()
+        }
+
+
+class Base64ImageField(Field):
+    """Изображение в Base64, проверенное целиком до сохранения рецепта.
+
+    Значение — пара (байты, расширение) для images.store_upload; превью
+    создаются в фоне (recipes.images).
+    """
+    default_error_messages = {
+        'invalid': 'Загрузите корректное изображение в Base64.',
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str) or not data.isascii():
+            self.fail('invalid')
+        try:
+            content = base64.b64decode(
+                data.rpartition(';base64,')[2], validate=True
+            )
+            extension = images.verify(content)
+        except (binascii.Error, ValueError):
+            self.fail('invalid')
+        return content, extension
+
+    def to_representation(self, value):
+        return default_storage.url(value.name) if value else None
+
+
+class ShortRecipeSerializer(RecipeImageMixin, ModelSerializer):
+    image_variant = 'thumbnail'
+    image = SerializerMethodField()
+
     class Meta:
         model = Recipe
         fields = 'id', 'name', 'image', 'cooking_time'
@@ -50,6 +122,8 @@ class UserSerializer(ModelSerializer):
         extra_kwargs = {'password': {'write_only': True}}
 
     def get_is_subscribed(self, user):
+        if hasattr(user, 'is_subscribed'):
+            return user.is_subscribed
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
@@ -78,15 +152,17 @@ class IngredientsEditSerializer(ModelSerializer):
 
 
 class RecipeIngredientSerializer(ModelSerializer):
+    """Название и единица ингредиента берутся из catalogue.
+
+    Снимок справочника можно передать в context['catalogue'], тогда
+    сериализатор точно не обратится к базе. Ингредиенты, которых нет в
+    снимке, заранее загружает attach_ingredients.
+    """
     id = ReadOnlyField(
-        source='ingredient.id'
-    )
-    name = ReadOnlyField(
-        source='ingredient.name'
-    )
-    measurement_unit = ReadOnlyField(
-        source='ingredient.measurement_unit'
+        source='ingredient_id'
     )
+    name = SerializerMethodField()
+    measurement_unit = SerializerMethodField()
 
     class Meta:
         model = RecipeIngredient
@@ -97,15 +173,21 @@ class RecipeIngredientSerializer(ModelSerializer):
             'amount'
         )
 
+    def get_ingredient(self, item):
+        snapshot = self.context.get('catalogue') or catalogue.get()
+        return snapshot.ingredients.get(item.ingredient_id) or item.ingredient
+
+    def get_name(self, item):
+        return self.get_ingredient(item).name
+
+    def get_measurement_unit(self, item):
+        return self.get_ingredient(item).measurement_unit
+
 
 class RecipePostSerializer(ModelSerializer):
-    tags = TagSerializer(many=True, read_only=True)
     author = UserSerializer(read_only=True)
     image = Base64ImageField()
-    tags = PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tag.objects.all()
-    )
+    tags = ListField(child=IntegerField())
     ingredients = IngredientsEditSerializer(many=True)
 
     class Meta:
@@ -114,27 +196,34 @@ class RecipePostSerializer(ModelSerializer):
         read_only_fields = ('author',)
 
     def validate(self, data):
-        ingredients = data['ingredients']
-        ingredient_list = []
-        for items in ingredients:
-            ingredient = get_object_or_404(
-                Ingredient, id=items['id']
-            )
-            if ingredient in ingredient_list:
+        if 'ingredients' in data:
+            ids = [item['id'] for item in data['ingredients']]
+            if len(set(ids)) != len(ids):
                 raise ValidationError(
                     'Ингредиент должен быть уникальным!'
                 )
-            ingredient_list.append(ingredient)
-        tags = data['tags']
-        if not tags:
-            raise ValidationError(
-                'Нужен хотя бы один тэг для рецепта!'
-            )
-        for tag_name in tags:
-            if not Tag.objects.filter(name=tag_name).exists():
+            # Снимок справочника может отставать от удаления, поэтому
+            # записываемые id сверяются с базой.
+            missing = set(ids) - set(Ingredient.objects.filter(
+                id__in=ids
+            ).values_list('id', flat=True))
+            if missing:
                 raise ValidationError(
-                    f'Тэга {tag_name} не существует!'
+                    f'Ингредиента {min(missing)} не существует!'
                 )
+        if 'tags' in data:
+            tags = data['tags']
+            if not tags:
+                raise ValidationError(
+                    'Нужен хотя бы один тэг для рецепта!'
+                )
+            found = Tag.objects.in_bulk(tags)
+            for tag_id in tags:
+                if tag_id not in found:
+                    raise ValidationError(
+                        f'Тэга {tag_id} не существует!'
+                    )
+            data['tags'] = [found[tag_id] for tag_id in dict.fromkeys(tags)]
         return data
 
     def validate_cooking_time(self, cooking_time):
@@ -157,14 +246,24 @@ class RecipePostSerializer(ModelSerializer):
         return ingredients
 
     def create_ingredients(self, ingredients, recipe):
-        for ingredient in ingredients:
-            RecipeIngredient.objects.create(
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
                 recipe=recipe,
                 ingredient_id=ingredient.get('id'),
                 amount=ingredient.get('amount'),
             )
+            for ingredient in ingredients
+        )
+
+    def store_image(self, validated_data):
+        if 'image' in validated_data:
+            validated_data['image'] = images.store_upload(
+                *validated_data['image']
+            )
 
+    @transaction.atomic
     def create(self, validated_data):
+        self.store_image(validated_data)
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
@@ -172,19 +271,59 @@ class RecipePostSerializer(ModelSerializer):
         self.create_ingredients(ingredients, recipe)
         return recipe
 
+    def update_ingredients(self, ingredients, recipe):
+        existing = {item.ingredient_id: item for item in recipe.recipe.all()}
+        old_amounts = {
+            ingredient_id: item.amount
+            for ingredient_id, item in existing.items()
+        }
+        amounts = {item['id']: item['amount'] for item in ingredients}
+        changed = []
+        for ingredient_id, item in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and amount != item.amount:
+                item.amount = amount
+                changed.append(item)
+        added = [
+            {'id': ingredient_id, 'amount': amount}
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
+        ]
+        removed = [
+            item.id for ingredient_id, item in existing.items()
+            if ingredient_id not in amounts
+        ]
+        RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        self.create_ingredients(added, recipe)
+        # Без сигналов: список покупок обновляется ниже одной командой.
+        bulk.delete(RecipeIngredient, None, id__in=removed)
+        shopping_list.change_recipe(recipe, old_amounts, amounts)
+        return len(changed) + len(added) + len(removed)
+
+    def update_tags(self, tags, recipe):
+        existing = {tag.id for tag in recipe.tags.all()}
+        new = {tag.id for tag in tags}
+        recipe.tags.remove(*(existing - new))
+        recipe.tags.add(*(new - existing))
+        return len(existing ^ new)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
+        self.store_image(validated_data)
+        self.rows_written = 1
         if 'ingredients' in validated_data:
-            ingredients = validated_data.pop('ingredients')
-            instance.ingredients.clear()
-            self.create_ingredients(ingredients, instance)
+            self.rows_written += self.update_ingredients(
+                validated_data.pop('ingredients'), instance
+            )
         if 'tags' in validated_data:
-            instance.tags.set(
-                validated_data.pop('tags')
+            self.rows_written += self.update_tags(
+                validated_data.pop('tags'), instance
             )
         return super().update(
             instance, validated_data)
 
     def to_representation(self, instance):
+        prefetch_related_objects([instance], 'recipe')
         return RecipeSerializer(
             instance,
             context={
@@ -193,12 +332,53 @@ class RecipePostSerializer(ModelSerializer):
         ).data
 
 
-class RecipeSerializer(ModelSerializer):
-    tags = TagSerializer(many=True, read_only=True)
+def attach_tag_ids(recipes):
+    """Записывает в recipe.tag_ids id тэгов одним запросом на всех."""
+    pending = {
+        recipe.id: recipe for recipe in recipes
+        if not hasattr(recipe, 'tag_ids')
+    }
+    if not pending:
+        return
+    for recipe in pending.values():
+        recipe.tag_ids = []
+    rows = Recipe.tags.through.objects.filter(
+        recipe_id__in=pending
+    ).order_by('id').values_list('recipe_id', 'tag_id')
+    for recipe_id, tag_id in rows:
+        pending[recipe_id].tag_ids.append(tag_id)
+
+
+def attach_ingredients(recipes):
+    """Загружает одним запросом ингредиенты, которых нет в catalogue."""
+    known = catalogue.get().ingredients
+    prefetch_related_objects([
+        item for recipe in recipes for item in recipe.recipe.all()
+        if item.ingredient_id not in known
+    ], 'ingredient')
+
+
+class RecipeListSerializer(ListSerializer):
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        attach_tag_ids(recipes)
+        if 'catalogue' not in self.context:
+            attach_ingredients(recipes)
+        return super().to_representation(recipes)
+
+
+class RecipeSerializer(RecipeImageMixin, ModelSerializer):
+    """Тэги рецепта берутся из catalogue, из базы читаются только их id.
+
+    Снимок справочника можно передать в context['catalogue'], как для
+    RecipeIngredientSerializer.
+    """
+    tags = SerializerMethodField()
     author = UserSerializer(read_only=True)
     is_favorited = SerializerMethodField()
     is_in_shopping_cart = SerializerMethodField()
-    image = Base64ImageField()
+    image = SerializerMethodField()
+    image_variants = SerializerMethodField()
     ingredients = RecipeIngredientSerializer(
         many=True,
         required=True,
@@ -216,23 +396,97 @@ class RecipeSerializer(ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time',
         )
+        list_serializer_class = RecipeListSerializer
+
+    @cached_property
+    def tag_serializer(self):
+        return TagSerializer(context=self.context)
+
+    def get_tags(self, recipe):
+        attach_tag_ids((recipe,))
+        snapshot = self.context.get('catalogue')
+        tags = (
+            snapshot.tags if snapshot is not None
+            else catalogue.in_bulk(Tag, recipe.tag_ids)
+        )
+        return [
+            self.tag_serializer.to_representation(tags[tag_id])
+            for tag_id in recipe.tag_ids
+        ]
+
+    def to_representation(self, recipe):
+        if 'catalogue' not in self.context:
+            attach_ingredients((recipe,))
+        if hasattr(recipe, 'author_is_subscribed'):
+            recipe.author.is_subscribed = recipe.author_is_subscribed
+        return super().to_representation(recipe)
 
     def get_is_favorited(self, recipe):
+        if hasattr(recipe, 'is_favorited'):
+            return recipe.is_favorited
         user = self.context.get('request').user
         return user.is_authenticated and Favorites.objects.filter(
             user=user, recipe=recipe.id
         ).exists()
 
     def get_is_in_shopping_cart(self, recipe):
+        if hasattr(recipe, 'is_in_shopping_cart'):
+            return recipe.is_in_shopping_cart
         user = self.context.get('request').user
         return user.is_authenticated and Cart.objects.filter(
             user=user, recipe=recipe.id
         ).exists()
 
 
+class RecipeMatchQuerySerializer(Serializer):
+    ingredients = ListField(
+        child=IntegerField(min_value=1), allow_empty=False, max_length=100
+    )
+    mode = ChoiceField(choices=MODES, default='missing')
+    missing = IntegerField(min_value=0, default=0)
+
+
+class RecipeIdsSerializer(Serializer):
+    recipes = ListField(
+        child=IntegerField(min_value=1), allow_empty=False, max_length=100
+    )
+
+    def validate_recipes(self, recipes):
+        recipes = list(dict.fromkeys(recipes))
+        found = set(Recipe.objects.filter(id__in=recipes).values_list(
+            'id', flat=True
+        ))
+        for recipe_id in recipes:
+            if recipe_id not in found:
+                raise ValidationError(f'Рецепта {recipe_id} не существует!')
+        return recipes
+
+
+class RecipeMatchSerializer(RecipeSerializer):
+    matched_count = IntegerField(read_only=True)
+    missing_count = IntegerField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + (
+            'matched_count',
+            'missing_count',
+        )
+
+
+class TokenRevokeSerializer(Serializer):
+    refresh = CharField()
+
+    def validate_refresh(self, refresh):
+        try:
+            return RefreshToken(refresh)
+        except TokenError as error:
+            raise ValidationError(str(error))
+
+
 class UserFollowSerializer(ModelSerializer):
     id = IntegerField(
         source='author.id')
@@ -278,12 +532,14 @@ class UserFollowSerializer(ModelSerializer):
         return data
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        user = obj.author
-        recipes = (
-            Recipe.objects.filter(author=user)[:int(limit)] if limit
-            else Recipe.objects.filter(author=user))
+        recipes = getattr(obj.author, 'limited_recipes', None)
+        if recipes is None:
+            request = self.context.get('request')
+            limit = request.GET.get('recipes_limit')
+            user = obj.author
+            recipes = (
+                Recipe.objects.filter(author=user)[:int(limit)] if limit
+                else Recipe.objects.filter(author=user))
         return ShortRecipeSerializer(
             recipes,
             many=True
@@ -293,11 +549,12 @@ class UserFollowSerializer(ModelSerializer):
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
+        if obj.user_id == request.user.id:
+            return True
         return Follow.objects.filter(
             user=request.user,
-            author=obj.user
+            author=obj.author
         ).exists()
 
     def get_recipes_count(self, obj):
-        user = obj.author
-        return Recipe.objects.filter(author=user).count()
+        return obj.author.recipes_count
@@ -0,0 +1,88 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+
+from recipes.images import variants_ready
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import User
+from . import instrumentation
+from .authentication import user_cache
+from .cache import GLOBAL_SCOPE, LIST_SCOPE, get_response_cache, recipe_scope
+
+
+def invalidate(*scopes):
+    transaction.on_commit(lambda: get_response_cache().bump(scopes))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(instance, **kwargs):
+    invalidate(LIST_SCOPE, recipe_scope(instance.pk))
+
+
+@receiver(variants_ready, sender=Recipe)
+def invalidate_recipe_image(recipe_id, **kwargs):
+    invalidate(LIST_SCOPE, recipe_scope(recipe_id))
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def invalidate_recipe_ingredient(instance, **kwargs):
+    invalidate(LIST_SCOPE, recipe_scope(instance.recipe_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(instance, action, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, Recipe):
+        invalidate(LIST_SCOPE, recipe_scope(instance.pk))
+    else:
+        invalidate(GLOBAL_SCOPE)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_catalogue(**kwargs):
+    invalidate(GLOBAL_SCOPE)
+
+
+# Поля пользователя, которые попадают в ответы с рецептами как автор.
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=User)
+def remember_author_fields(instance, update_fields=None, **kwargs):
+    instance.saved_author = None
+    if instance.pk is None or (
+        update_fields is not None
+        and set(update_fields).isdisjoint(AUTHOR_FIELDS)
+    ):
+        return
+    instance.saved_author = (
+        User.objects.filter(pk=instance.pk).values(*AUTHOR_FIELDS).first()
+    )
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(instance, created, **kwargs):
+    # Регистрация, вход и смена пароля не меняют ответы с рецептами, а
+    # рецепты удалённого автора сбрасывают кэш своими сигналами.
+    old = getattr(instance, 'saved_author', None)
+    if created or old is None or all(
+        old[field] == getattr(instance, field) for field in AUTHOR_FIELDS
+    ):
+        return
+    recipe_ids = list(instance.recipes.values_list('id', flat=True))
+    if recipe_ids:
+        invalidate(LIST_SCOPE, *map(recipe_scope, recipe_ids))
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_cached_user(instance, **kwargs):
+    user_cache.invalidate(instance.pk)
+
+
+@receiver(connection_created)
+def instrument_connection(connection, **kwargs):
+    instrumentation.install(connection)
@@ -0,0 +1,715 @@
+import base64
+import json
+import os
+import subprocess
+import sys
+from io import BytesIO
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import AsyncRequestFactory, SimpleTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from recipes.catalogue import catalogue
+from recipes.models import (FeedEntry, Ingredient, Recipe, RecipeIngredient,
+                            Tag)
+from users.models import User
+from . import async_views
+from .cache import LIST_SCOPE, get_response_cache
+from .throttling import UserRateThrottle, limiter
+
+
+class RecipeAPITestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='cook@example.com',
+            username='cook',
+            first_name='Иван',
+            last_name='Поваров',
+            password='password',
+        )
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        cls.ingredient = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+
+    def setUp(self):
+        # Снимок справочника, кэш ответов и вёдра ограничения частоты
+        # живут дольше тестовой транзакции.
+        catalogue.invalidate()
+        get_response_cache().backend.clear()
+        caches[settings.THROTTLING['CACHE']].clear()
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, name, amount=10, author=None):
+        recipe = Recipe.objects.create(
+            author=author or self.user,
+            name=name,
+            image='recipe_image/test.png',
+            text='Описание',
+            cooking_time=10,
+        )
+        recipe.tags.add(self.tag)
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=self.ingredient, amount=amount
+        )
+        return recipe
+
+
+class RecipeListQueriesTest(RecipeAPITestCase):
+    def get_page(self, limit):
+        response = self.client.get('/api/recipes/', {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+
+    def test_queries_do_not_depend_on_page_size(self):
+        for number in range(20):
+            self.create_recipe(f'Рецепт {number}')
+        self.get_page(1)
+        with CaptureQueriesContext(connection) as queries:
+            self.get_page(2)
+        with self.assertNumQueries(len(queries)):
+            self.get_page(20)
+
+    def test_ingredients_outside_catalogue_are_loaded_once(self):
+        for number in range(20):
+            self.create_recipe(f'Рецепт {number}')
+        with self.settings(INGREDIENT_INDEX_MAX_SIZE=0):
+            catalogue.invalidate()
+            self.assertFalse(catalogue.get().ingredients_loaded)
+            self.get_page(1)
+            with CaptureQueriesContext(connection) as queries:
+                self.get_page(2)
+            with self.assertNumQueries(len(queries)):
+                self.get_page(20)
+
+
+class CursorPaginationTest(RecipeAPITestCase):
+    def walk(self, url, direction):
+        names = []
+        while url:
+            data = self.client.get(url).json()
+            self.assertNotIn('count', data)
+            page = [item['name'] for item in data['results']]
+            names = names + page if direction == 'next' else page + names
+            url = data[direction]
+        return names, data
+
+    def test_cursor_pages_forward_and_back(self):
+        for number in range(5):
+            self.create_recipe(f'Рецепт {number}')
+        expected = [f'Рецепт {number}' for number in range(4, -1, -1)]
+        names, last = self.walk('/api/recipes/?cursor=&limit=2', 'next')
+        self.assertEqual(names, expected)
+        names, _ = self.walk(last['previous'], 'previous')
+        self.assertEqual(names, expected[:4])
+
+    def test_invalid_cursor_is_not_found(self):
+        for cursor in ('garbage', 'eyJ2IjogWzFdfQ=='):
+            response = self.client.get('/api/recipes/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404)
+
+    def test_page_size_is_capped(self):
+        for number in range(3):
+            self.create_recipe(f'Рецепт {number}')
+        with mock.patch(
+            'api.pagination.PageLimitPagination.max_page_size', 2
+        ):
+            response = self.client.get(
+                '/api/recipes/', {'cursor': '', 'limit': 1000}
+            )
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+
+
+class RecipeTagFilterTest(RecipeAPITestCase):
+    def filter_names(self, *slugs):
+        response = self.client.get('/api/recipes/', {'tags': slugs})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], len(response.data['results']))
+        return sorted(item['name'] for item in response.data['results'])
+
+    def test_several_tags_match_each_recipe_once(self):
+        dinner = Tag.objects.create(
+            name='Ужин', color='#8775D2', slug='dinner'
+        )
+        self.create_recipe('Блины').tags.add(dinner)
+        self.create_recipe('Суп').tags.set([dinner])
+        self.create_recipe('Каша')
+        catalogue.invalidate()
+        self.assertEqual(self.filter_names('dinner'), ['Блины', 'Суп'])
+        self.assertEqual(
+            self.filter_names('breakfast', 'dinner'), ['Блины', 'Каша', 'Суп']
+        )
+        response = self.client.get('/api/recipes/', {'tags': 'lunch'})
+        self.assertEqual(response.status_code, 400)
+
+
+class RecipeSearchTest(RecipeAPITestCase):
+    def search(self, value):
+        response = self.client.get('/api/recipes/', {'search': value})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.data['results']]
+
+    def test_words_are_matched_by_stem_and_ranked_by_field(self):
+        with mock.patch(
+            'recipes.signals.schedule_variants'
+        ), self.captureOnCommitCallbacks(execute=True):
+            self.create_recipe('Блины')
+            soup = self.create_recipe('Суп')
+            soup.text = 'Подавать с блинами'
+            soup.save()
+            self.create_recipe('Каша')
+        self.assertEqual(self.search('блин'), ['Блины', 'Суп'])
+        self.assertEqual(self.search('муки'), ['Каша', 'Суп', 'Блины'])
+        self.assertEqual(self.search('блин муки'), ['Блины', 'Суп'])
+        self.assertEqual(self.search('борщ'), [])
+
+
+class FeedTest(RecipeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        override = self.settings(FEED_FAN_OUT_LIMIT=1, FEED_ASYNC=False)
+        override.enable()
+        self.addCleanup(override.disable)
+        patcher = mock.patch('recipes.signals.schedule_variants')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_user(self, name):
+        return User.objects.create_user(
+            email=f'{name}@example.com', username=name, first_name=name,
+            last_name=name, password='password',
+        )
+
+    def follow(self, user, author):
+        self.client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/users/{author.id}/subscribe/')
+        self.client.force_authenticate(self.user)
+
+    def publish(self, name, author):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.create_recipe(name, author=author).id
+
+    def read_feed(self):
+        names, url = [], '/api/recipes/feed/?limit=2'
+        while url:
+            data = self.client.get(url).json()
+            names += [item['name'] for item in data['results']]
+            url = data['next']
+        return names
+
+    def test_feed_merges_fanned_out_and_celebrity_recipes(self):
+        author = self.create_user('author')
+        celebrity = self.create_user('star')
+        self.publish('Старый', author)
+        self.follow(self.user, author)
+        self.follow(self.user, celebrity)
+        self.follow(self.create_user('fan'), celebrity)
+        for number in range(2):
+            self.publish(f'Обычный {number}', author)
+            self.publish(f'Звёздный {number}', celebrity)
+        self.publish('Свой', self.user)
+        self.assertEqual(self.read_feed(), [
+            'Звёздный 1', 'Обычный 1', 'Звёздный 0', 'Обычный 0', 'Старый',
+        ])
+        self.assertFalse(FeedEntry.objects.filter(author=celebrity).exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/users/{author.id}/subscribe/')
+        self.assertEqual(self.read_feed(), ['Звёздный 1', 'Звёздный 0'])
+
+
+class BulkRelationsTest(RecipeAPITestCase):
+    def bulk(self, method, path, recipes):
+        response = getattr(self.client, method)(
+            f'/api/recipes/{path}/', {'recipes': recipes}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_repeated_requests_change_nothing(self):
+        first, second, third = (
+            self.create_recipe(name).id for name in ('Блины', 'Суп', 'Каша')
+        )
+        self.assertEqual(
+            self.bulk('post', 'favorite', [first, second]),
+            {'added': [first, second]},
+        )
+        self.assertEqual(
+            self.bulk('post', 'favorite', [first, second, third]),
+            {'added': [third]},
+        )
+        response = self.client.post(f'/api/recipes/{first}/favorite/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Recipe.objects.get(pk=first).favorites_count, 1)
+        for added in ([first, second, third], []):
+            response = self.client.post(
+                '/api/recipes/shopping_cart/from_favorites/'
+            )
+            self.assertEqual(response.json(), {'added': added})
+        self.assertEqual(
+            self.bulk('delete', 'shopping_cart', [first, first]),
+            {'removed': [first]},
+        )
+        self.assertEqual(
+            self.bulk('delete', 'shopping_cart', [first]), {'removed': []}
+        )
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'format': 'csv'}
+        )
+        self.assertIn(
+            'мука,г,20', b''.join(response.streaming_content).decode()
+        )
+        response = self.client.post(
+            '/api/recipes/favorite/', {'recipes': [third + 1]}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class RecipeUpdateShoppingListTest(RecipeAPITestCase):
+    def download(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'format': 'csv'}
+        )
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_changed_amount_reaches_downloaded_list(self):
+        recipe = self.create_recipe('Блины', amount=10)
+        self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        for amount in (100, 20):
+            ingredients = [{'id': self.ingredient.id, 'amount': amount}]
+            response = self.client.patch(
+                f'/api/recipes/{recipe.id}/', {'ingredients': ingredients},
+                format='json',
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(f'мука,г,{amount}', self.download().splitlines())
+
+
+class RecipeIngredientsWriteTest(RecipeAPITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'специя {number}', measurement_unit='г')
+            for number in range(20)
+        )
+
+    def patch_ingredients(self, recipe, ingredients):
+        return self.client.patch(
+            f'/api/recipes/{recipe.id}/', {'ingredients': ingredients},
+            format='json',
+        )
+
+    def test_queries_do_not_depend_on_ingredient_count(self):
+        recipes = [self.create_recipe(f'Рецепт {number}') for number in (1, 2)]
+        self.patch_ingredients(
+            recipes[0], [{'id': self.ingredient.id, 'amount': 5}]
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.patch_ingredients(recipes[0], [
+                {'id': ingredient.id, 'amount': 5}
+                for ingredient in self.ingredients[:2]
+            ])
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(len(queries)):
+            response = self.patch_ingredients(recipes[1], [
+                {'id': ingredient.id, 'amount': 5}
+                for ingredient in self.ingredients
+            ])
+        self.assertEqual(len(response.data['ingredients']), 20)
+
+    def test_duplicate_and_unknown_ingredients_are_rejected(self):
+        recipe = self.create_recipe('Блины')
+        missing = max(item.id for item in self.ingredients) + 1
+        for ingredients in (
+            [{'id': self.ingredient.id, 'amount': 5}] * 2,
+            [{'id': missing, 'amount': 5}],
+            [{'id': self.ingredient.id, 'amount': 0}],
+            [],
+        ):
+            response = self.patch_ingredients(recipe, ingredients)
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            list(recipe.recipe.values_list('ingredient_id', 'amount')),
+            [(self.ingredient.id, 10)],
+        )
+
+
+class SubscriptionsTest(RecipeAPITestCase):
+    def get_page(self, limit):
+        response = self.client.get(
+            '/api/users/subscriptions/',
+            {'limit': limit, 'recipes_limit': 2},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+        return response.data['results']
+
+    def test_queries_do_not_depend_on_page_size(self):
+        for number in range(6):
+            author = User.objects.create_user(
+                email=f'author{number}@example.com',
+                username=f'author{number}', first_name='Автор',
+                last_name=str(number), password='password',
+            )
+            for recipe in range(number % 4):
+                self.create_recipe(f'Рецепт {recipe}', author=author)
+            response = self.client.post(f'/api/users/{author.id}/subscribe/')
+            self.assertEqual(response.status_code, 200)
+        self.get_page(1)
+        with CaptureQueriesContext(connection) as queries:
+            self.get_page(2)
+        with self.assertNumQueries(len(queries)):
+            results = self.get_page(6)
+        self.assertEqual(
+            [item['recipes_count'] for item in results], [0, 1, 2, 3, 0, 1]
+        )
+        self.assertEqual(
+            [len(item['recipes']) for item in results], [0, 1, 2, 2, 0, 1]
+        )
+        self.assertTrue(all(item['is_subscribed'] for item in results))
+
+
+class AuthorCacheInvalidationTest(RecipeAPITestCase):
+    def list_version(self):
+        return get_response_cache().versions([LIST_SCOPE])[0]
+
+    def test_signup_login_and_password_keep_cached_lists(self):
+        self.create_recipe('Блины')
+        version = self.list_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user(
+                email='new@example.com', username='new', first_name='new',
+                last_name='new', password='password',
+            )
+            self.user.last_login = timezone.now()
+            self.user.save(update_fields=['last_login'])
+            self.user.set_password('new-password')
+            self.user.save()
+        self.assertEqual(self.list_version(), version)
+
+    def test_author_name_change_resets_cached_lists(self):
+        self.create_recipe('Блины')
+        version = self.list_version()
+        self.user.first_name = 'Пётр'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertNotEqual(self.list_version(), version)
+
+
+class AsyncReadViewsTest(RecipeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.header = f'Token {Token.objects.create(user=self.user).key}'
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=self.header)
+
+    async def call(self, handler, path, **kwargs):
+        request = AsyncRequestFactory().get(
+            path, authorization=self.header
+        )
+        request.user = await async_views.authenticate(request)
+        return await handler(request, **kwargs)
+
+    def assert_same(self, handler, path, **kwargs):
+        expected = self.client.get(path)
+        self.assertEqual(expected.status_code, 200)
+        response = async_to_sync(self.call)(handler, path, **kwargs)
+        self.assertEqual(json.loads(response.content), expected.json())
+
+    def test_responses_match_sync_views(self):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Авторов', password='password',
+        )
+        recipes = [
+            self.create_recipe(f'Рецепт {number}', author=author)
+            for number in range(3)
+        ]
+        self.client.post(f'/api/recipes/{recipes[0].id}/favorite/')
+        self.client.post(f'/api/recipes/{recipes[1].id}/shopping_cart/')
+        self.client.post(f'/api/users/{author.id}/subscribe/')
+        recipe_id = recipes[0].id
+        for handler, path, kwargs in (
+            (async_views.recipe_list, '/api/recipes/?limit=2&page=2', {}),
+            (async_views.recipe_list, '/api/recipes/?is_favorited=1', {}),
+            (async_views.recipe_detail, f'/api/recipes/{recipe_id}/',
+             {'pk': str(recipe_id)}),
+            (async_views.tag_list, '/api/tags/', {}),
+            (async_views.ingredient_list, '/api/ingredients/?name=му', {}),
+            (async_views.subscriptions,
+             '/api/users/subscriptions/?recipes_limit=2', {}),
+        ):
+            with self.subTest(path=path):
+                self.assert_same(handler, path, **kwargs)
+
+    def test_unsupported_requests_fall_back_to_sync_view(self):
+        sync_view = mock.Mock(return_value='sync')
+        view = async_views.async_read_view(
+            async_views.recipe_list, sync_view,
+            async_views.RECIPE_LIST_PARAMS,
+        )
+        for path in ('/api/recipes/?cursor=', '/api/recipes/?page=x'):
+            request = AsyncRequestFactory().get(
+                path, authorization=self.header
+            )
+            self.assertEqual(async_to_sync(view)(request), 'sync')
+        self.assertEqual(sync_view.call_count, 2)
+
+
+class JWTAuthenticationTest(RecipeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(None)
+
+    def post(self, path, data, access=None):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {access}'} if access else {}
+        return self.client.post(
+            f'/api/auth/jwt/{path}/', data, format='json', **headers
+        )
+
+    def get_me(self, access):
+        return self.client.get(
+            '/api/users/me/', HTTP_AUTHORIZATION=f'Bearer {access}'
+        ).status_code
+
+    def test_refresh_rotation_and_revocation(self):
+        tokens = self.post(
+            'create', {'email': 'cook@example.com', 'password': 'password'}
+        ).json()
+        self.assertEqual(self.get_me(tokens['access']), 200)
+        rotated = self.post('refresh', {'refresh': tokens['refresh']}).json()
+        self.assertNotEqual(rotated['refresh'], tokens['refresh'])
+        response = self.post('refresh', {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, 401)
+        response = self.post(
+            'revoke', {'refresh': rotated['refresh']}, rotated['access']
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_me(rotated['access']), 401)
+        self.assertEqual(self.get_me(tokens['access']), 200)
+        response = self.post('refresh', {'refresh': rotated['refresh']})
+        self.assertEqual(response.status_code, 401)
+
+
+class RecipeTagsTest(RecipeAPITestCase):
+    def test_tags_are_read_from_catalogue(self):
+        recipe = self.create_recipe('Блины')
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data['tags'],
+            [{'id': self.tag.id, 'name': 'Завтрак', 'color': '#E26C2D',
+              'slug': 'breakfast'}],
+        )
+
+    def test_deleted_tag_in_stale_catalogue_is_rejected(self):
+        recipe = self.create_recipe('Блины')
+        tag = Tag.objects.create(name='Ужин', color='#8775D2', slug='dinner')
+        catalogue.invalidate()
+        snapshot = catalogue.get()
+        tag_id = tag.id
+        tag.delete()
+        # Снимок воркера, который ещё не заметил удаления в другом процессе.
+        with mock.patch.object(catalogue, 'get', return_value=snapshot):
+            response = self.client.patch(
+                f'/api/recipes/{recipe.id}/', {'tags': [tag_id]},
+                format='json',
+            )
+        self.assertEqual(response.status_code, 400)
+
+
+def png_base64():
+    buffer = BytesIO()
+    Image.new('RGB', (32, 32), 'orange').save(buffer, 'PNG')
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+class RecipeImageTest(RecipeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = self.settings(
+            MEDIA_ROOT=media.name, RECIPE_IMAGE_ASYNC=False
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def post_recipe(self, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/recipes/', {
+                'name': 'Блины',
+                'text': 'Описание',
+                'cooking_time': 20,
+                'tags': [self.tag.id],
+                'ingredients': [{'id': self.ingredient.id, 'amount': 10}],
+                'image': f'data:image/png;base64,{image}',
+            }, format='json')
+
+    def test_upload_is_saved_before_response(self):
+        response = self.post_recipe(png_base64())
+        self.assertEqual(response.status_code, 201)
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        self.assertTrue(default_storage.exists(recipe.image.name))
+        self.assertEqual(recipe.image_variants['source'], recipe.image.name)
+        self.assertIn('thumbnail', recipe.image_variants)
+
+    def test_corrupt_upload_is_rejected(self):
+        header = png_base64()[:24]
+        for image in (header + 'A' * 64, header + '!!!!'):
+            response = self.post_recipe(image)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('image', response.data)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_failed_variants_are_recorded(self):
+        with mock.patch(
+            'recipes.images.generate_variants', side_effect=OSError
+        ), self.assertLogs('recipes.images', 'ERROR'):
+            response = self.post_recipe(png_base64())
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        self.assertEqual(
+            recipe.image_variants,
+            {'source': recipe.image.name, 'failed': True},
+        )
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.data['image_variants'], {})
+        self.assertTrue(response.data['image'].endswith(recipe.image.name))
+
+
+class ShoppingListErrorsTest(RecipeAPITestCase):
+    def test_errors_are_json_in_every_format(self):
+        self.client.force_authenticate(None)
+        for format in ('txt', 'csv', 'pdf'):
+            response = self.client.get(
+                '/api/recipes/download_shopping_cart/', {'format': format}
+            )
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertIn('detail', json.loads(response.content))
+
+
+class DownloadLimitsTest(RecipeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        recipe = self.create_recipe('Блины')
+        self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+
+    def download(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'format': 'txt'}
+        )
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def test_rate_limit_answers_429(self):
+        with mock.patch.dict(
+            UserRateThrottle.THROTTLE_RATES, {'download': '2/min'}
+        ):
+            for _ in range(2):
+                self.assertEqual(self.download().status_code, 200)
+            response = self.download()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_requests_over_concurrency_limit_answer_503(self):
+        limit = settings.THROTTLING['CONCURRENCY']['download']
+        for _ in range(limit):
+            self.assertTrue(limiter.acquire('download'))
+        try:
+            response = self.download()
+        finally:
+            for _ in range(limit):
+                limiter.release('download')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(
+            response['Retry-After'], str(settings.THROTTLING['RETRY_AFTER'])
+        )
+        for _ in range(limit + 1):
+            self.assertEqual(self.download().status_code, 200)
+
+
+class LargeIngredientCatalogueTest(RecipeAPITestCase):
+    def setUp(self):
+        override = self.settings(INGREDIENT_INDEX_MAX_SIZE=0)
+        override.enable()
+        self.addCleanup(override.disable)
+        super().setUp()
+
+    def test_ingredients_are_served_from_database(self):
+        self.assertEqual(catalogue.get().ingredient_list, ())
+        expected = {
+            'id': self.ingredient.id, 'name': 'мука', 'measurement_unit': 'г'
+        }
+        for path, params in (
+            ('/api/ingredients/', {}),
+            ('/api/ingredients/', {'name': 'му'}),
+        ):
+            response = self.client.get(path, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), [expected])
+        response = self.client.get(f'/api/ingredients/{self.ingredient.id}/')
+        self.assertEqual(response.json(), expected)
+        recipe = self.create_recipe('Блины')
+        response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(
+            response.json()['ingredients'], [{**expected, 'amount': 10}]
+        )
+
+
+class ProductionProfileTest(SimpleTestCase):
+    def load_settings(self, **env):
+        env = {
+            name: value for name, value in os.environ.items()
+            if name not in ('ALLOWED_HOSTS', 'SECRET_KEY')
+        } | {'DJANGO_PROFILE': 'production', 'SECRET_KEY': 'key', **env}
+        return subprocess.run(
+            [sys.executable, '-c',
+             'from django.conf import settings; '
+             'print(settings.ALLOWED_HOSTS, '
+             'settings.INSTRUMENTATION["SERVER_TIMING"])'],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+
+    def test_allowed_hosts_are_required(self):
+        result = self.load_settings()
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("KeyError: 'ALLOWED_HOSTS'", result.stderr)
+        result = self.load_settings(ALLOWED_HOSTS='example.com')
+        self.assertEqual(result.stdout.split(), ["['example.com']", 'False'])
+
+
+class IngredientSearchTest(RecipeAPITestCase):
+    def search(self, name):
+        response = self.client.get('/api/ingredients/', {'name': name})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.json()]
+
+    def test_prefix_matches_come_before_substring_matches(self):
+        for name in ('кукурузная мука', 'мускат', 'соль'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+        catalogue.invalidate()
+        expected = ['мука', 'мускат', 'кукурузная мука']
+        self.assertEqual(self.search('МУ'), expected)
+        with self.settings(INGREDIENT_SEARCH_LIMIT=2):
+            self.assertEqual(self.search('му'), expected[:2])
+        with self.settings(INGREDIENT_INDEX_MAX_SIZE=0):
+            catalogue.invalidate()
+            self.assertEqual(self.search('му'), expected)
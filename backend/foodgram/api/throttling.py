@@ -0,0 +1,212 @@
+"""Ограничение частоты и одновременности дорогих запросов.
+
+Действия представлений отнесены к областям (throttle_scopes), для
+которых в DEFAULT_THROTTLE_RATES заданы частоты: область — на
+пользователя, область_ip — на адрес клиента. Частота N/период —
+ведро на N запросов, которое пополняется N раз за период; состояние
+ведра лежит в кэше THROTTLING['CACHE'], общем для воркеров. Кроме того,
+число одновременно выполняемых запросов области в одном воркере
+ограничено THROTTLING['CONCURRENCY']: лишние сразу получают 503 с
+Retry-After, а не ждут в очереди, занимая поток. Отказы учитываются в
+метриках как foodgram_shed_requests_total.
+"""
+from threading import BoundedSemaphore, Lock
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import SimpleRateThrottle
+
+from .instrumentation import get_registry, view_name
+
+
+def throttle_scope(view):
+    """Область текущего действия представления или None."""
+    scopes = getattr(view, 'throttle_scopes', None)
+    if scopes is None:
+        return getattr(view, 'throttle_scope', None)
+    return scopes.get(getattr(view, 'action', None))
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """Ведро токенов области throttle_scope(view) + suffix.
+
+    Чтение и запись ведра в одном процессе идут под блокировкой;
+    между воркерами гонка возможна, как и у SimpleRateThrottle, и
+    пропускает не больше запросов, чем воркеров.
+    """
+    suffix = ''
+    cache_format = 'throttle:%(scope)s:%(ident)s'
+    _lock = Lock()
+
+    def __init__(self):
+        # Область известна только из представления, см. allow_request.
+        self.cache = caches[settings.THROTTLING['CACHE']]
+
+    def allow_request(self, request, view):
+        scope = throttle_scope(view)
+        if not settings.THROTTLING['ENABLED'] or scope is None:
+            return True
+        self.scope = scope + self.suffix
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        now = self.timer()
+        with self._lock:
+            tokens, updated = self.cache.get(
+                self.key, (self.num_requests, now)
+            )
+            self.tokens = min(
+                self.num_requests,
+                tokens + (now - updated) * self.num_requests / self.duration,
+            )
+            if self.tokens < 1:
+                return False
+            self.cache.set(self.key, (self.tokens - 1, now), self.duration)
+        return True
+
+    def wait(self):
+        return (1 - self.tokens) * self.duration / self.num_requests
+
+
+class UserRateThrottle(TokenBucketThrottle):
+    """Частота области для аутентифицированного пользователя."""
+
+    def get_cache_key(self, request, view):
+        if not request.user.is_authenticated:
+            return None
+        return self.cache_format % {
+            'scope': self.scope, 'ident': request.user.pk
+        }
+
+
+class IPRateThrottle(TokenBucketThrottle):
+    """Частота области_ip для адреса клиента, в том числе анонимного."""
+    suffix = '_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope, 'ident': self.get_ident(request)
+        }
+
+
+class Overloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Сервер перегружен, повторите запрос позже.'
+    default_code = 'overloaded'
+
+    def __init__(self, wait):
+        super().__init__()
+        self.wait = wait
+
+
+class ConcurrencyLimiter:
+    """Семафоры областей из THROTTLING['CONCURRENCY'] в этом процессе."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._slots = {}
+
+    def semaphore(self, scope):
+        limit = settings.THROTTLING['CONCURRENCY'].get(scope)
+        if limit is None:
+            return None
+        with self._lock:
+            if scope not in self._slots:
+                self._slots[scope] = BoundedSemaphore(limit)
+            return self._slots[scope]
+
+    def acquire(self, scope):
+        """Занимает место; None — для области нет ограничения."""
+        semaphore = self.semaphore(scope)
+        if semaphore is None:
+            return None
+        return semaphore.acquire(blocking=False)
+
+    def release(self, scope):
+        self._slots[scope].release()
+
+
+limiter = ConcurrencyLimiter()
+
+
+class Released:
+    """Тело потокового ответа, освобождающее место по окончании.
+
+    Сервер закрывает ответ и тогда, когда клиент отключился до начала
+    передачи, поэтому место освобождает close(), а не finally
+    генератора, который в этом случае не выполнился бы.
+    """
+
+    def __init__(self, content, scope):
+        self.content = iter(content)
+        self.scope = scope
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.content)
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        scope, self.scope = self.scope, None
+        if scope is not None:
+            limiter.release(scope)
+
+
+class AdmissionControlMixin:
+    """Ограничивает одновременные запросы действий из throttle_scopes.
+
+    Отказы по частоте и по одновременности учитываются в метриках.
+
+    Место занимается после аутентификации, проверки прав и частоты и
+    освобождается, когда ответ сформирован, а для потоковых ответов —
+    когда тело отдано клиенту.
+    """
+    admitted_scope = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        scope = throttle_scope(self)
+        if scope is None or not settings.THROTTLING['ENABLED']:
+            return
+        admitted = limiter.acquire(scope)
+        if admitted is False:
+            get_registry().shed(view_name(request), 'overloaded')
+            raise Overloaded(settings.THROTTLING['RETRY_AFTER'])
+        if admitted:
+            self.admitted_scope = scope
+
+    def throttled(self, request, wait):
+        get_registry().shed(view_name(request), 'throttled')
+        super().throttled(request, wait)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if self.admitted_scope is not None and response.streaming:
+            response.streaming_content = Released(
+                response.streaming_content, self.admitted_scope
+            )
+            self.admitted_scope = None
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            # Здесь, а не в finalize_response: его не вызывают, если
+            # исключение не обработано.
+            scope, self.admitted_scope = self.admitted_scope, None
+            if scope is not None:
+                limiter.release(scope)
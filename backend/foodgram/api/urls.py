@@ -1,7 +1,11 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from .async_views import asyncify
+from .views import (IngredientViewSet, MetricsView, RecipeViewSet,
+                    ResponseCacheStatsView, TagViewSet, TokenRevokeView,
+                    UserViewSet)
 
 router_v1 = DefaultRouter()
 
@@ -27,7 +31,14 @@ router_v1.register(
 )
 
 urlpatterns = [
-    path('', include(router_v1.urls)),
+    path('cache-stats/', ResponseCacheStatsView.as_view()),
+    path('metrics/', MetricsView.as_view()),
+    path('', include(
+        asyncify(router_v1.urls) if settings.ASYNC_READ_VIEWS
+        else router_v1.urls
+    )),
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
+    path('auth/jwt/revoke/', TokenRevokeView.as_view(), name='jwt-revoke'),
+    path('auth/', include('djoser.urls.jwt')),
 ]
@@ -1,36 +1,102 @@
 from datetime import datetime
+from itertools import chain
 
-from django.db.models import Q, Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.db.models import (Exists, F, OuterRef, Prefetch, Window,
+                              prefetch_related_objects)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
-from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import (SAFE_METHODS, IsAdminUser,
+                                        IsAuthenticated)
 from rest_framework.response import Response
 from rest_framework.status import (HTTP_201_CREATED, HTTP_204_NO_CONTENT,
                                    HTTP_400_BAD_REQUEST)
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
+from rest_framework_simplejwt.tokens import AccessToken
 
+from recipes import relations
+from recipes.autocomplete import ingredient_index
+from recipes.catalogue import catalogue
+from recipes.matching import recipe_match_index
 from recipes.models import (Cart, Favorites, Ingredient, Recipe,
-                            RecipeIngredient, Tag)
+                            ShoppingListItem, Tag)
 from users.models import Follow, User
-from .filters import IngredientFilter, RecipeFilter
-from .pagination import PageLimitPagination
-from .permissions import AdminOrReadOnly, OwnerAdminOrReadOnly
-from .serializers import (IngredientSerializer, RecipePostSerializer,
-                          RecipeSerializer, ShortRecipeSerializer,
-                          TagSerializer, UserFollowSerializer, UserSerializer)
+from . import authentication
+from .cache import CachedResponseMixin, get_response_cache
+from .filters import RecipeFilter
+from .instrumentation import InstrumentedViewMixin, get_registry
+from .pagination import FeedPagination, PageLimitPagination
+from .permissions import AdminOrReadOnly, MetricsAccess, OwnerAdminOrReadOnly
+from .renderers import SHOPPING_LIST_RENDERERS, PrometheusRenderer
+from .serializers import (IngredientSerializer, RecipeIdsSerializer,
+                          RecipeMatchQuerySerializer, RecipeMatchSerializer,
+                          RecipePostSerializer, RecipeSerializer,
+                          ShortRecipeSerializer,
+                          TagSerializer, TokenRevokeSerializer,
+                          UserFollowSerializer, UserSerializer)
+from .throttling import AdmissionControlMixin
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+def limited_recipes(author_ids, limit=None):
+    """Последние limit рецептов каждого автора одним запросом."""
+    recipes = Recipe.objects.filter(author_id__in=author_ids)
+    if limit is None or limit < 0:
+        return recipes
+    ranked = recipes.annotate(recipe_rank=Window(
+        RowNumber(),
+        partition_by=F('author_id'),
+        order_by=F('pub_date').desc(),
+    )).order_by().values('id', 'recipe_rank')
+    sql, params = ranked.query.sql_with_params()
+    return recipes.filter(id__in=RawSQL(
+        f'SELECT id FROM ({sql}) ranked WHERE recipe_rank <= %s',
+        (*params, limit)
+    ))
+
+
+class CatalogueViewSet(InstrumentedViewMixin, ReadOnlyModelViewSet):
+    """Справочник, который читается из catalogue без запросов к базе.
+
+    Если модели нет в снимке (большой справочник ингредиентов), запросы
+    обслуживает обычный ReadOnlyModelViewSet.
+    """
+    permission_classes = (AdminOrReadOnly,)
+
+    def get_catalogue_items(self):
+        return catalogue.get().items(self.queryset.model)
+
+    def list(self, request, *args, **kwargs):
+        items = self.get_catalogue_items()
+        if items is None:
+            return super().list(request, *args, **kwargs)
+        return Response(self.get_serializer(items.values(), many=True).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        items = self.get_catalogue_items()
+        if items is None:
+            return super().retrieve(request, *args, **kwargs)
+        try:
+            item = items[int(kwargs['pk'])]
+        except (KeyError, ValueError):
+            raise Http404
+        return Response(self.get_serializer(item).data)
+
+
+class TagViewSet(CatalogueViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
-    permission_classes = (AdminOrReadOnly,)
 
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(InstrumentedViewMixin, CachedResponseMixin,
+                    AdmissionControlMixin, ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     pagination_class = PageLimitPagination
@@ -38,23 +104,65 @@ class RecipeViewSet(ModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
     add_serializer = ShortRecipeSerializer
+    cursor_ordering = ('-pub_date', '-id')
+    throttle_scopes = {
+        'create': 'recipe_write',
+        'update': 'recipe_write',
+        'partial_update': 'recipe_write',
+        'download_shopping_cart': 'download',
+    }
 
-    def _add_del_obj(self, obj_id, m2m_model, q):
-        obj = get_object_or_404(self.queryset, id=obj_id)
-        serializer = self.add_serializer(obj)
-        m2m_obj = m2m_model.objects.filter(q & Q(user=self.request.user))
-
-        if (self.request.method in ('POST',)) and not m2m_obj:
-            m2m_model(None, obj.id, self.request.user.id).save()
-            return Response(serializer.data, status=HTTP_201_CREATED)
+    def get_queryset(self):
+        queryset = Recipe.objects.select_related('author').prefetch_related(
+            'recipe'
+        )
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset
+        return queryset.annotate(
+            is_favorited=Exists(Favorites.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(Cart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            author_is_subscribed=Exists(Follow.objects.filter(
+                user=user, author=OuterRef('author')
+            )),
+        )
 
-        if (self.request.method in ('DELETE',)) and m2m_obj:
-            m2m_obj[0].delete()
+    def _add_del_obj(self, obj_id, m2m_model):
+        obj = get_object_or_404(self.queryset, id=obj_id)
+        user = self.request.user
+        if self.request.method == 'POST':
+            if relations.add(m2m_model, user, (obj.id,)):
+                serializer = self.add_serializer(obj)
+                return Response(serializer.data, status=HTTP_201_CREATED)
+        elif relations.remove(m2m_model, user, (obj.id,)):
             return Response(status=HTTP_204_NO_CONTENT)
-
         return Response(status=HTTP_400_BAD_REQUEST)
 
+    def _bulk_add_del(self, request, m2m_model):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        if request.method == 'POST':
+            return Response({'added': sorted(
+                relations.add(m2m_model, request.user, recipe_ids)
+            )})
+        return Response({'removed': sorted(
+            relations.remove(m2m_model, request.user, recipe_ids)
+        )})
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in ('list', 'match', 'feed'):
+            context['image_variant'] = 'card'
+        return context
+
     def get_serializer_class(self):
+        if self.action == 'match':
+            return RecipeMatchSerializer
         if self.request.method in SAFE_METHODS:
             return RecipeSerializer
         return RecipePostSerializer
@@ -62,79 +170,174 @@ class RecipeViewSet(ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        if settings.DEBUG:
+            response['X-Rows-Written'] = self.rows_written
+        return response
+
+    def perform_update(self, serializer):
+        serializer.save()
+        self.rows_written = serializer.rows_written
+
     @action(methods=['post', 'delete'],
             detail=True,
             permission_classes=(IsAuthenticated,))
     def favorite(self, request, pk=None):
-        return self._add_del_obj(pk, Favorites, Q(recipe__id=pk))
+        return self._add_del_obj(pk, Favorites)
 
     @action(methods=['post', 'delete'],
             detail=True,
             permission_classes=(IsAuthenticated,))
     def shopping_cart(self, request, pk=None):
-        return self._add_del_obj(pk, Cart, Q(recipe__id=pk))
+        return self._add_del_obj(pk, Cart)
 
-    @action(methods=['get'],
+    @action(methods=['post', 'delete'],
             detail=False,
+            url_path='favorite',
+            url_name='favorite-bulk',
             permission_classes=(IsAuthenticated,))
-    def download_shopping_cart(self, request):
-        user = self.request.user
-        if not user.cart.exists():
-            return Response(status=HTTP_400_BAD_REQUEST)
+    def favorite_bulk(self, request):
+        return self._bulk_add_del(request, Favorites)
 
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__in_cart__user=user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(amount=Sum('amount'))
+    @action(methods=['post', 'delete'],
+            detail=False,
+            url_path='shopping_cart',
+            url_name='shopping-cart-bulk',
+            permission_classes=(IsAuthenticated,))
+    def shopping_cart_bulk(self, request):
+        return self._bulk_add_del(request, Cart)
 
-        today = datetime.today()
-        shopping_list = (
-            f'Список покупок для: {user.get_full_name()}\n\n'
-            f'Дата: {today:%Y-%m-%d}\n\n'
-        )
+    @action(methods=['post'],
+            detail=False,
+            url_path='shopping_cart/from_favorites',
+            url_name='shopping-cart-from-favorites',
+            permission_classes=(IsAuthenticated,))
+    def favorites_to_cart(self, request):
+        return Response({'added': sorted(
+            relations.favorites_to_cart(request.user)
+        )})
 
-        shopping_list += '\n'.join([
-            f'- {ingredient["ingredient__name"]} '
-            f'({ingredient["ingredient__measurement_unit"]})'
-            f' - {ingredient["amount"]}'
-            for ingredient in ingredients
-        ])
+    @action(methods=['get'], detail=False)
+    def match(self, request):
+        params = RecipeMatchQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        page = self.paginate_queryset(recipe_match_index.match(
+            params.validated_data['ingredients'],
+            params.validated_data['mode'],
+            params.validated_data['missing'],
+        ))
+        recipes = self.get_queryset().in_bulk(
+            recipe_id for recipe_id, _, _ in page
+        )
+        results = []
+        for recipe_id, matched, missing in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.matched_count = matched
+                recipe.missing_count = missing
+                results.append(recipe)
+        serializer = self.get_serializer(results, many=True)
+        return self.get_paginated_response(serializer.data)
 
-        shopping_list += f'\n\nFoodgram ({today:%Y})'
+    @action(methods=['get'],
+            detail=False,
+            permission_classes=(IsAuthenticated,),
+            pagination_class=FeedPagination)
+    def feed(self, request):
+        entries = self.paginator.paginate_timeline(request.user, request)
+        recipes = self.get_queryset().in_bulk(entry.id for entry in entries)
+        serializer = self.get_serializer(
+            [recipes[entry.id] for entry in entries if entry.id in recipes],
+            many=True,
+        )
+        return self.get_paginated_response(serializer.data)
 
-        filename = f'{user.username}_shopping_list.txt'
-        response = HttpResponse(shopping_list, content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename={filename}'
+    @action(methods=['get'],
+            detail=False,
+            permission_classes=(IsAuthenticated,),
+            renderer_classes=SHOPPING_LIST_RENDERERS)
+    def download_shopping_cart(self, request):
+        user = self.request.user
+        ingredients = ShoppingListItem.objects.filter(user=user).values(
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            amount=F('total_amount'),
+        ).order_by(
+            'ingredient__measurement_unit',
+            'ingredient__name'
+        ).iterator()
+        first = next(ingredients, None)
+        if first is None:
+            return Response(status=HTTP_400_BAD_REQUEST)
 
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(
+                chain((first,), ingredients), user, datetime.today()
+            ),
+            content_type=renderer.get_content_type(),
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename={renderer.get_filename(user)}'
+        )
         return response
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogueViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
-    permission_classes = (AdminOrReadOnly,)
-    filter_backends = (DjangoFilterBackend,)
-    filterset_class = IngredientFilter
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
 
 
-class UserViewSet(DjoserViewSet):
+class UserViewSet(InstrumentedViewMixin, DjoserViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     pagination_class = PageLimitPagination
+    cursor_ordering = ('id',)
+
+    def get_serializer_class(self):
+        if self.action in ('subscriptions', 'subscribe'):
+            return UserFollowSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset
+        return queryset.annotate(is_subscribed=Exists(Follow.objects.filter(
+            user=user, author=OuterRef('pk')
+        )))
+
+    def prefetch_recipes(self, follows):
+        try:
+            limit = int(self.request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            limit = None
+        author_ids = [follow.author_id for follow in follows]
+        prefetch_related_objects(follows, Prefetch(
+            'author__recipes',
+            queryset=limited_recipes(author_ids, limit),
+            to_attr='limited_recipes',
+        ))
 
     @action(methods=['get'],
             detail=False,
             permission_classes=(IsAuthenticated,))
     def subscriptions(self, request):
         user = request.user
-        queryset = Follow.objects.filter(user=user)
+        queryset = Follow.objects.filter(user=user).select_related(
+            'author'
+        ).order_by('id')
         pages = self.paginate_queryset(queryset)
-        serializer = UserFollowSerializer(
-            pages, many=True,
-            context={'request': request}
-        )
+        self.prefetch_recipes(pages)
+        serializer = self.get_serializer(pages, many=True)
         return self.get_paginated_response(serializer.data)
 
     @action(methods=['post', 'delete'],
@@ -145,13 +348,46 @@ class UserViewSet(DjoserViewSet):
         author = get_object_or_404(User, pk=id)
 
         if request.method == 'POST':
-            Follow.objects.create(user=user, author=author)
-            serializer = UserFollowSerializer(
-                author,
-                context={'request': request}
-            )
+            if user == author:
+                raise ValidationError(
+                    'Вы не можете подписаться на самого себя!'
+                )
+            if not relations.follow(user, author):
+                raise ValidationError(
+                    'Вы уже подписаны на этого пользователя!'
+                )
+            follow = Follow(user=user, author=author)
+            self.prefetch_recipes([follow])
+            serializer = self.get_serializer(follow)
             return Response(serializer.data)
 
-        follow = get_object_or_404(Follow, user=user, author=author)
-        follow.delete()
+        if not relations.unfollow(user, author):
+            raise Http404
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class TokenRevokeView(APIView):
+    """Выход: отзывает refresh-токен и текущий access-токен."""
+
+    def post(self, request):
+        serializer = TokenRevokeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.validated_data['refresh'].blacklist()
+        if isinstance(request.auth, AccessToken):
+            authentication.revoke(request.auth)
+        return Response(status=HTTP_204_NO_CONTENT)
+
+
+class ResponseCacheStatsView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(get_response_cache().stats.as_dict())
+
+
+class MetricsView(APIView):
+    permission_classes = (MetricsAccess,)
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request):
+        return Response(get_registry().render())
@@ -1,4 +1,6 @@
+import json
 import os
+from datetime import timedelta
 
 from pathlib import Path
 from dotenv import load_dotenv
@@ -10,12 +12,31 @@ load_dotenv()
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
-SECRET_KEY = 'n-&d(3=e@j@*4rsc$73g(+9#%ad67lh33lxjws_s2p6%z*&n94'
+# development — локальный запуск, production — сервер за nginx.
+PROFILE = os.getenv('DJANGO_PROFILE', 'development')
+PRODUCTION = PROFILE == 'production'
+
+# wsgi — gunicorn с потоками, asgi — gunicorn с воркерами uvicorn.
+SERVER_INTERFACE = os.getenv('SERVER_INTERFACE', 'wsgi')
+# Асинхронные версии читающих представлений (api/async_views.py).
+ASYNC_READ_VIEWS = os.getenv(
+    'ASYNC_READ_VIEWS', str(SERVER_INTERFACE == 'asgi')
+) == 'True'
+
+if PRODUCTION:
+    SECRET_KEY = os.environ['SECRET_KEY']
+else:
+    SECRET_KEY = os.getenv(
+        'SECRET_KEY', 'n-&d(3=e@j@*4rsc$73g(+9#%ad67lh33lxjws_s2p6%z*&n94'
+    )
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv('DEBUG', str(not PRODUCTION)) == 'True'
 
-ALLOWED_HOSTS = ['*']
+if PRODUCTION:
+    ALLOWED_HOSTS = os.environ['ALLOWED_HOSTS'].split(',')
+else:
+    ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '*').split(',')
 
 
 INSTALLED_APPS = [
@@ -28,6 +49,7 @@ INSTALLED_APPS = [
 
     'rest_framework',
     'rest_framework.authtoken',
+    'rest_framework_simplejwt.token_blacklist',
     'djoser',
     'django_filters',
 
@@ -37,6 +59,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,6 +88,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
+ASGI_APPLICATION = 'foodgram.asgi.application'
 
 
 DATABASES = {
@@ -74,9 +98,24 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='127.0.0.1'),
-        'PORT': os.getenv('DB_PORT', default='5432')
+        'PORT': os.getenv('DB_PORT', default='5432'),
+        # Под ASGI каждый запрос может попасть в новый поток, и постоянные
+        # соединения копились бы; там соединения держит пулер (PgBouncer).
+        'CONN_MAX_AGE': int(os.getenv(
+            'CONN_MAX_AGE',
+            60 if PRODUCTION and SERVER_INTERFACE == 'wsgi' else 0
+        )),
+        'CONN_HEALTH_CHECKS': True,
+        # PgBouncer в режиме transaction не поддерживает серверные курсоры.
+        'DISABLE_SERVER_SIDE_CURSORS': (
+            os.getenv('DB_POOLER', 'False') == 'True'
+        ),
     }
 }
+if DATABASES['default']['ENGINE'].endswith('postgresql'):
+    DATABASES['default']['OPTIONS'] = {
+        'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+    }
 
 AUTH_USER_MODEL = 'users.User'
 
@@ -127,11 +166,168 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+DEFAULT_PAGE_SIZE = 6
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 100))
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 20))
+INGREDIENT_INDEX_MAX_SIZE = int(os.getenv('INGREDIENT_INDEX_MAX_SIZE', 50000))
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': (160, 160),
+    'card': (600, 600),
+    'full': (1600, 1600),
+}
+RECIPE_IMAGE_QUALITY = 80
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', 2))
+RECIPE_IMAGE_ASYNC = os.getenv('RECIPE_IMAGE_ASYNC', 'True') == 'True'
+
+CATALOGUE_CACHE = 'shared'
+CATALOGUE_CHECK_INTERVAL = float(os.getenv('CATALOGUE_CHECK_INTERVAL', 1))
+
+RECIPE_MATCH_INDEX_TTL = int(os.getenv('RECIPE_MATCH_INDEX_TTL', 600))
+
+FEED_FAN_OUT_LIMIT = int(os.getenv('FEED_FAN_OUT_LIMIT', 5000))
+FEED_BATCH_SIZE = int(os.getenv('FEED_BATCH_SIZE', 1000))
+FEED_BACKFILL = int(os.getenv('FEED_BACKFILL', 50))
+FEED_WORKERS = int(os.getenv('FEED_WORKERS', 2))
+FEED_ASYNC = os.getenv('FEED_ASYNC', 'True') == 'True'
+
+TRENDING_HALF_LIFE_HOURS = float(os.getenv('TRENDING_HALF_LIFE_HOURS', 48))
+# Сколько ждать события с id меньше уже учтённого (транзакция ещё не
+# закоммичена) и сколько таких id помнить.
+TRENDING_PENDING_TIMEOUT = int(os.getenv('TRENDING_PENDING_TIMEOUT', 600))
+TRENDING_PENDING_LIMIT = int(os.getenv('TRENDING_PENDING_LIMIT', 10000))
+
+# На сервере ответы и версии областей лежат в общем кэше: сброс версии
+# после изменения данных виден всем воркерам, а не только тому, который
+# обработал запрос. Кэш в памяти процесса годится для локального запуска.
+RESPONSE_CACHE = {
+    'ENABLED': os.getenv('RESPONSE_CACHE_ENABLED', 'True') == 'True',
+    'BACKEND': os.getenv(
+        'RESPONSE_CACHE_BACKEND',
+        'api.cache.DjangoCacheBackend' if PRODUCTION
+        else 'api.cache.LocalLRUBackend'
+    ),
+    'OPTIONS': json.loads(os.getenv(
+        'RESPONSE_CACHE_OPTIONS', '{"alias": "shared"}' if PRODUCTION else '{}'
+    )),
+    'TIMEOUT': int(os.getenv('RESPONSE_CACHE_TIMEOUT', 60)),
+    'VERSION_TIMEOUT': 24 * 60 * 60,
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': os.getenv(
+            'SHARED_CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'SHARED_CACHE_LOCATION', '/tmp/foodgram-shared'
+        ),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+THROTTLING = {
+    'ENABLED': os.getenv('THROTTLING_ENABLED', 'True') == 'True',
+    'CACHE': 'shared',
+    'CONCURRENCY': {
+        'download': int(os.getenv('DOWNLOAD_CONCURRENCY', 2)),
+        'recipe_write': int(os.getenv('RECIPE_WRITE_CONCURRENCY', 2)),
+    },
+    'RETRY_AFTER': int(os.getenv('OVERLOAD_RETRY_AFTER', 1)),
+}
+
+INSTRUMENTATION = {
+    'ENABLED': os.getenv('INSTRUMENTATION_ENABLED', 'True') == 'True',
+    'SAMPLE_RATE': float(os.getenv('INSTRUMENTATION_SAMPLE_RATE', 0.1)),
+    # Заголовок раскрывает число запросов к базе и их время любому
+    # клиенту, поэтому на сервере он выключен по умолчанию.
+    'SERVER_TIMING': os.getenv(
+        'SERVER_TIMING_ENABLED', str(not PRODUCTION)
+    ) == 'True',
+    'METRICS_TOKEN': os.getenv('METRICS_TOKEN', ''),
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'instrumentation': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'api.instrumentation': {
+            'handlers': ['instrumentation'],
+            'level': os.getenv('INSTRUMENTATION_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+if PRODUCTION:
+    SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+    SESSION_COOKIE_SECURE = CSRF_COOKIE_SECURE = (
+        os.getenv('HTTPS', 'False') == 'True'
+    )
+    CSRF_TRUSTED_ORIGINS = [
+        origin for origin in os.getenv('CSRF_TRUSTED_ORIGINS', '').split(',')
+        if origin
+    ]
+    SECURE_CONTENT_TYPE_NOSNIFF = True
+    X_FRAME_OPTIONS = 'DENY'
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'api.authentication.JWTAuthentication',
         'rest_framework.authentication.TokenAuthentication',
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'api.throttling.UserRateThrottle',
+        'api.throttling.IPRateThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'download': os.getenv('DOWNLOAD_RATE', '20/min'),
+        'download_ip': os.getenv('DOWNLOAD_IP_RATE', '60/min'),
+        'recipe_write': os.getenv('RECIPE_WRITE_RATE', '30/min'),
+        'recipe_write_ip': os.getenv('RECIPE_WRITE_IP_RATE', '60/min'),
+    },
+    'NUM_PROXIES': (
+        int(os.getenv('NUM_PROXIES')) if os.getenv('NUM_PROXIES') else None
+    ),
+}
+
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(
+        minutes=int(os.getenv('JWT_ACCESS_MINUTES', 5))
+    ),
+    'REFRESH_TOKEN_LIFETIME': timedelta(
+        days=int(os.getenv('JWT_REFRESH_DAYS', 7))
+    ),
+    'ROTATE_REFRESH_TOKENS': True,
+    'BLACKLIST_AFTER_ROTATION': True,
+    'AUTH_HEADER_TYPES': ('Bearer',),
 }
+JWT_USER_CACHE_SIZE = int(os.getenv('JWT_USER_CACHE_SIZE', 10000))
+JWT_USER_CACHE_TTL = int(os.getenv('JWT_USER_CACHE_TTL', 60))
+
+if PRODUCTION:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = [
+        'rest_framework.renderers.JSONRenderer',
+    ]
@@ -0,0 +1,33 @@
+"""Настройки gunicorn; читаются из текущего каталога при запуске.
+
+SERVER_INTERFACE=wsgi запускает потоковые воркеры (gthread) поверх
+foodgram.wsgi, asgi — воркеры uvicorn поверх foodgram.asgi. Число
+воркеров и потоков по умолчанию выводится из числа процессоров и
+переопределяется GUNICORN_WORKERS и GUNICORN_THREADS.
+"""
+import multiprocessing
+import os
+
+interface = os.getenv('SERVER_INTERFACE', 'wsgi')
+cpus = multiprocessing.cpu_count()
+
+bind = os.getenv('GUNICORN_BIND', '0:8000')
+if interface == 'asgi':
+    wsgi_app = 'foodgram.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    workers = int(os.getenv('GUNICORN_WORKERS', cpus + 1))
+else:
+    wsgi_app = 'foodgram.wsgi:application'
+    worker_class = 'gthread'
+    # Каждый поток держит своё постоянное соединение с базой:
+    # workers * threads не должно превышать max_connections PostgreSQL.
+    workers = int(os.getenv('GUNICORN_WORKERS', cpus * 2 + 1))
+    threads = int(os.getenv('GUNICORN_THREADS', 4))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+# Перезапуск воркеров ограничивает рост памяти процессных кэшей.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = max_requests // 10
+accesslog = '-'
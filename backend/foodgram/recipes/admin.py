@@ -1,6 +1,9 @@
 from django.contrib import admin
 
-from .models import Cart, Favorites, Ingredient, Recipe, RecipeIngredient, Tag
+from . import search
+from .matching import recipe_match_index
+from .models import (Cart, Favorites, Ingredient, Recipe, RecipeIngredient,
+                     ShoppingListItem, Tag)
 
 
 class IngredientAdmin(admin.TabularInline):
@@ -8,13 +11,20 @@ class IngredientAdmin(admin.TabularInline):
 
 
 class RecipeAdmin(admin.ModelAdmin):
+    list_display = ('name', 'author', 'favorites_count')
     inlines = [
         IngredientAdmin,
     ]
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        search.schedule(form.instance.pk)
+        recipe_match_index.schedule(form.instance.pk)
+
 
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Ingredient)
 admin.site.register(Tag)
 admin.site.register(Cart)
 admin.site.register(Favorites)
+admin.site.register(ShoppingListItem)
@@ -0,0 +1,90 @@
+from bisect import bisect_left
+from threading import Lock
+
+from django.conf import settings
+
+from .catalogue import catalogue
+from .models import Ingredient
+
+
+class IngredientIndex:
+    """Отсортированный в памяти список ингредиентов для автодополнения.
+
+    Индекс строится из снимка catalogue при первом запросе после смены
+    снимка, поэтому изменения ингредиентов доходят до всех воркеров так
+    же, как справочник. Если ингредиентов больше INGREDIENT_INDEX_MAX_SIZE,
+    их нет в снимке, и поиск выполняется в базе данных.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._snapshot = None
+        self._keys = None
+        self._items = None
+
+    def _build(self, snapshot):
+        with self._lock:
+            if self._snapshot is snapshot:
+                return
+            if not snapshot.ingredients_loaded:
+                keys, items = (), None
+            else:
+                rows = sorted(
+                    (item.name.lower(), item.id, item.name,
+                     item.measurement_unit)
+                    for item in snapshot.ingredient_list
+                )
+                keys = tuple(row[0] for row in rows)
+                items = tuple(
+                    {'id': id, 'name': name, 'measurement_unit': unit}
+                    for _, id, name, unit in rows
+                )
+            self._keys, self._items = keys, items
+            self._snapshot = snapshot
+
+    def search(self, query, limit=None):
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        query = query.strip().lower()
+        if not query:
+            return []
+        snapshot = catalogue.get()
+        if self._snapshot is not snapshot:
+            self._build(snapshot)
+        keys, items = self._keys, self._items
+        if items is None:
+            return self._search_db(query, limit)
+
+        start = position = bisect_left(keys, query)
+        while (
+            position < len(keys)
+            and position - start < limit
+            and keys[position].startswith(query)
+        ):
+            position += 1
+        result = list(items[start:position])
+        if len(result) < limit:
+            for index, key in enumerate(keys):
+                if query in key and not key.startswith(query):
+                    result.append(items[index])
+                    if len(result) == limit:
+                        break
+        return result
+
+    def _search_db(self, query, limit):
+        # istartswith и icontains на PostgreSQL — UPPER(name) LIKE, их
+        # обслуживают индексы по UPPER(name) из миграции 0013 и 0004.
+        fields = ('id', 'name', 'measurement_unit')
+        result = list(
+            Ingredient.objects.filter(name__istartswith=query)
+            .order_by('name').values(*fields)[:limit]
+        )
+        if len(result) < limit:
+            result += list(
+                Ingredient.objects.filter(name__icontains=query)
+                .exclude(name__istartswith=query)
+                .order_by('name').values(*fields)[:limit - len(result)]
+            )
+        return result
+
+
+ingredient_index = IngredientIndex()
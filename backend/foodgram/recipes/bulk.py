@@ -0,0 +1,119 @@
+"""Вставка и удаление пачки строк одной SQL-командой.
+
+INSERT ... ON CONFLICT и DELETE ... RETURNING поддерживают PostgreSQL и
+SQLite 3.35+. RETURNING сообщает, какие строки действительно вставлены
+или удалены, поэтому производные данные можно обновить ровно на них, а
+повторный или параллельный запрос ничего не меняет дважды.
+"""
+from django.db import connection
+
+
+def column(model, name):
+    return connection.ops.quote_name(model._meta.get_field(name).column)
+
+
+def table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def execute(sql, params, returning):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        if returning is None:
+            return None
+        return [row[0] for row in cursor.fetchall()]
+
+
+def prepare(model, fields, row):
+    """Значения row в том виде, в каком их сохранил бы ORM."""
+    return [
+        model._meta.get_field(field).get_db_prep_save(value, connection)
+        for field, value in zip(fields, row)
+    ]
+
+
+def returning_clause(model, returning):
+    return f' RETURNING {column(model, returning)}' if returning else ''
+
+
+def insert(model, fields, rows, conflict='DO NOTHING', returning=None,
+           batch_size=1000):
+    """Вставляет rows (кортежи значений fields) по batch_size за команду.
+
+    conflict — продолжение ON CONFLICT, returning — поле, значения
+    которого вернуть для вставленных строк.
+    """
+    rows = list(rows)
+    placeholders = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    prefix = (
+        f'INSERT INTO {table(model)} '
+        f'({", ".join(column(model, field) for field in fields)}) VALUES '
+    )
+    suffix = f' ON CONFLICT {conflict}' + returning_clause(model, returning)
+    result = []
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        values = execute(
+            prefix + ', '.join([placeholders] * len(batch)) + suffix,
+            [value for row in batch for value in prepare(model, fields, row)],
+            returning,
+        )
+        result.extend(values or ())
+    return result
+
+
+def insert_from(model, fields, source, source_fields, conflict='DO NOTHING',
+                returning=None, **conditions):
+    """INSERT INTO model (fields) SELECT source_fields FROM source WHERE ...
+
+    Значения source_fields — имена полей source или кортежи (значение,)
+    для константы.
+    """
+    selected, params = [], []
+    for field, source_field in zip(fields, source_fields):
+        if isinstance(source_field, tuple):
+            selected.append('%s')
+            params.extend(prepare(model, (field,), source_field))
+        else:
+            selected.append(column(source, source_field))
+    where, where_params = conditions_clause(source, conditions)
+    sql = (
+        f'INSERT INTO {table(model)} '
+        f'({", ".join(column(model, field) for field in fields)}) '
+        f'SELECT {", ".join(selected)} FROM {table(source)} WHERE {where} '
+        f'ON CONFLICT {conflict}'
+        + returning_clause(model, returning)
+    )
+    return execute(sql, params + where_params, returning)
+
+
+def conditions_clause(model, conditions):
+    """field=значение или field__in=список, объединённые через AND."""
+    where, params = [], []
+    for lookup, value in conditions.items():
+        name, _, operator = lookup.partition('__')
+        if operator == 'in':
+            value = list(value)
+            where.append(
+                f'{column(model, name)} IN ({", ".join(["%s"] * len(value))})'
+            )
+            params.extend(value)
+        else:
+            where.append(f'{column(model, name)} = %s')
+            params.append(value)
+    return ' AND '.join(where), params
+
+
+def delete(model, returning, **conditions):
+    """Удаляет строки по условиям и возвращает значения поля returning."""
+    if any(
+        lookup.endswith('__in') and not value
+        for lookup, value in conditions.items()
+    ):
+        return []
+    where, params = conditions_clause(model, conditions)
+    sql = (
+        f'DELETE FROM {table(model)} WHERE {where}'
+        + returning_clause(model, returning)
+    )
+    return execute(sql, params, returning)
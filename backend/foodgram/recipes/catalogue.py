@@ -0,0 +1,129 @@
+"""Справочник тэгов и ингредиентов в памяти процесса.
+
+Тэги и ингредиенты почти не меняются, поэтому каждый воркер один раз
+читает их в неизменяемый снимок (словари id → объект и slug → id) и
+дальше отвечает из него без запросов к базе. Снимок помечен версией из
+общего кэша CATALOGUE_CACHE; сигналы сохранения и удаления после
+коммита записывают туда новую версию. Воркер сверяет версию не чаще
+раза в CATALOGUE_CHECK_INTERVAL секунд, так что изменения из других
+процессов видны с этой задержкой, а из своего — сразу. Объекты снимка
+общие для всех запросов и не должны изменяться.
+
+Если ингредиентов больше INGREDIENT_INDEX_MAX_SIZE, в снимок попадают
+только тэги (ingredients_loaded = False): ингредиенты читаются из базы,
+чтобы большой справочник не занимал память каждого воркера.
+"""
+from threading import Lock
+from time import monotonic
+from types import MappingProxyType
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Ingredient, Tag
+
+VERSION_KEY = 'catalogue:version'
+
+
+class Snapshot:
+    def __init__(self, version, tags, ingredients):
+        self.version = version
+        self.tag_list = tuple(tags)
+        self.tags = MappingProxyType({tag.id: tag for tag in self.tag_list})
+        self.tag_ids = MappingProxyType(
+            {tag.slug: tag.id for tag in self.tag_list}
+        )
+        self.ingredients_loaded = ingredients is not None
+        self.ingredient_list = tuple(ingredients or ())
+        self.ingredients = MappingProxyType(
+            {ingredient.id: ingredient for ingredient in self.ingredient_list}
+        )
+
+    def items(self, model):
+        """Словарь id → объект для Tag или Ingredient.
+
+        None, если ингредиенты в снимок не загружены.
+        """
+        if model is Tag:
+            return self.tags
+        return self.ingredients if self.ingredients_loaded else None
+
+
+class Catalogue:
+    def __init__(self):
+        self._lock = Lock()
+        self._snapshot = None
+        self._checked_at = 0
+
+    @property
+    def cache(self):
+        return caches[settings.CATALOGUE_CACHE]
+
+    def shared_version(self):
+        version = self.cache.get(VERSION_KEY)
+        if version is not None:
+            return version
+        version = uuid4().hex
+        if self.cache.add(VERSION_KEY, version, None):
+            return version
+        return self.cache.get(VERSION_KEY, version)
+
+    def invalidate(self):
+        """Новая версия для всех процессов; вызывать после коммита."""
+        self.cache.set(VERSION_KEY, uuid4().hex, None)
+        self._snapshot = None
+
+    def current(self):
+        """Актуальный снимок или None, если его нужно загрузить.
+
+        Не обращается к базе, поэтому годится и для асинхронного кода.
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        if monotonic() - self._checked_at < settings.CATALOGUE_CHECK_INTERVAL:
+            return snapshot
+        if snapshot.version != self.shared_version():
+            return None
+        self._checked_at = monotonic()
+        return snapshot
+
+    def load(self):
+        with self._lock:
+            # Версия читается до данных: изменение, сделанное во время
+            # загрузки, сменит её и вызовет новую загрузку.
+            version = self.shared_version()
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = Snapshot(
+                    version,
+                    Tag.objects.order_by('id'),
+                    self.load_ingredients(),
+                )
+            self._checked_at = monotonic()
+            return self._snapshot
+
+    def load_ingredients(self):
+        limit = settings.INGREDIENT_INDEX_MAX_SIZE
+        if Ingredient.objects.order_by()[limit:limit + 1].exists():
+            return None
+        return Ingredient.objects.order_by('id')
+
+    def get(self):
+        return self.current() or self.load()
+
+    def in_bulk(self, model, ids):
+        """Как model.objects.in_bulk(ids) для Tag или Ingredient.
+
+        Чего нет в снимке (например, создано другим процессом после
+        последней сверки версии), ищется в базе.
+        """
+        items = self.get().items(model) or {}
+        found = {pk: items[pk] for pk in ids if pk in items}
+        missing = set(ids) - found.keys()
+        if missing:
+            found.update(model.objects.in_bulk(missing))
+        return found
+
+
+catalogue = Catalogue()
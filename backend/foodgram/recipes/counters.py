@@ -0,0 +1,57 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from users.models import Follow, User
+
+from .models import Favorites, Recipe
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorites, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+
+
+def change(model, field, pk, delta):
+    """Атомарно сдвигает счётчик на delta, не опуская его ниже нуля."""
+    change_many(model, field, (pk,), delta)
+
+
+def change_many(model, field, pks, delta):
+    """change для нескольких строк одним UPDATE."""
+    queryset = model.objects.filter(pk__in=pks)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def expected_counts(source, link):
+    return Coalesce(
+        Subquery(
+            source.objects.filter(**{link: OuterRef('pk')})
+            .order_by().values(link).annotate(total=Count('pk'))
+            .values('total'),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def mismatches():
+    """Возвращает {(модель, поле): число строк с неверным счётчиком}."""
+    result = {}
+    for model, field, source, link in COUNTERS:
+        wrong = model.objects.annotate(
+            expected=expected_counts(source, link)
+        ).exclude(**{field: F('expected')}).count()
+        if wrong:
+            result[model._meta.label, field] = wrong
+    return result
+
+
+def rebuild():
+    """Пересчитывает все счётчики одним UPDATE на каждое поле."""
+    for model, field, source, link in COUNTERS:
+        model.objects.update(
+            **{field: expected_counts(source, link)}
+        )
@@ -0,0 +1,195 @@
+"""Лента новых рецептов от авторов из подписок.
+
+Лента хранится готовой: при публикации рецепта его id пачками
+записывается в FeedEntry каждому подписчику автора (fan-out on write),
+и чтение страницы — один проход по индексу (user, -pub_date, -recipe).
+Для авторов, у которых подписчиков больше FEED_FAN_OUT_LIMIT, записи не
+размножаются: их рецепты подмешиваются при чтении по индексу рецептов
+автора (fan-out on read). При подписке в ленту добавляются последние
+FEED_BACKFILL рецептов автора, при отписке — удаляются.
+"""
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from users.models import Follow, User
+
+from .models import FeedEntry, Recipe
+
+logger = logging.getLogger(__name__)
+
+Entry = namedtuple('Entry', 'pub_date id')
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.FEED_WORKERS,
+        thread_name_prefix='feed',
+    )
+
+
+def is_celebrity(author_id):
+    return User.objects.filter(
+        pk=author_id, followers_count__gt=settings.FEED_FAN_OUT_LIMIT
+    ).exists()
+
+
+def insert(user_ids, recipes):
+    """Записывает рецепты (id, автор, дата) в ленты пользователей."""
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(
+                user_id=user_id, recipe_id=recipe_id,
+                author_id=author_id, pub_date=pub_date,
+            )
+            for user_id in user_ids
+            for recipe_id, author_id, pub_date in recipes
+        ),
+        ignore_conflicts=True,
+    )
+
+
+def run_in_worker(user_ids, recipes):
+    try:
+        insert(user_ids, recipes)
+    except Exception:
+        logger.exception('Не удалось разослать рецепты %s', recipes)
+    finally:
+        connection.close()
+
+
+def distribute(user_ids, recipes):
+    """Пишет в ленты пачками по FEED_BATCH_SIZE подписчиков.
+
+    Если пачка не одна, они уходят в пул потоков, чтобы публикация
+    рецепта у автора с большим числом подписчиков не ждала всех вставок.
+    """
+    size = settings.FEED_BATCH_SIZE
+    batches = [
+        user_ids[start:start + size]
+        for start in range(0, len(user_ids), size)
+    ]
+    if len(batches) > 1 and settings.FEED_ASYNC:
+        for batch in batches:
+            get_executor().submit(run_in_worker, batch, recipes)
+        return
+    for batch in batches:
+        insert(batch, recipes)
+
+
+def latest_recipes(author_id):
+    return list(
+        Recipe.objects.filter(author_id=author_id)
+        .order_by('-pub_date', '-id')
+        .values_list('id', 'author_id', 'pub_date')[:settings.FEED_BACKFILL]
+    )
+
+
+def fan_out(recipe_id, author_id, pub_date):
+    if is_celebrity(author_id):
+        return
+    followers = list(Follow.objects.filter(author_id=author_id).values_list(
+        'user_id', flat=True
+    ))
+    distribute(followers, [(recipe_id, author_id, pub_date)])
+
+
+def schedule(recipe):
+    args = recipe.pk, recipe.author_id, recipe.pub_date
+    transaction.on_commit(lambda: fan_out(*args))
+
+
+def backfill(user_id, author_id):
+    if not is_celebrity(author_id):
+        insert([user_id], latest_recipes(author_id))
+
+
+def restore(author_id):
+    """Заполняет ленты подписчиков автора, ставшего обычным.
+
+    Пока подписчиков было больше порога, рецепты автора в ленты не
+    писались; когда их число опускается до порога, ленты дописываются.
+    """
+    if User.objects.filter(
+        pk=author_id, followers_count=settings.FEED_FAN_OUT_LIMIT
+    ).exists():
+        distribute(
+            list(Follow.objects.filter(author_id=author_id).values_list(
+                'user_id', flat=True
+            )),
+            latest_recipes(author_id),
+        )
+
+
+def schedule_backfill(user_id, author_id):
+    transaction.on_commit(lambda: backfill(user_id, author_id))
+
+
+def unfollow(user_id, author_id):
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+    transaction.on_commit(lambda: restore(author_id))
+
+
+def before(queryset, field, cursor):
+    """Строго после cursor в порядке (-pub_date, -field).
+
+    Условие pub_date <= ... вынесено отдельно, чтобы оно стало границей
+    диапазона в индексе, а не фильтром по всей ленте.
+    """
+    if cursor is None:
+        return queryset
+    pub_date, recipe_id = cursor
+    return queryset.filter(
+        Q(pub_date__lt=pub_date) | Q(**{f'{field}__lt': recipe_id}),
+        pub_date__lte=pub_date,
+    )
+
+
+def timeline(user, limit, cursor=None):
+    """limit записей ленты новее всего, начиная после cursor.
+
+    Возвращает список Entry(pub_date, id рецепта).
+    """
+    entries = before(FeedEntry.objects.filter(user=user), 'recipe_id', cursor)
+    rows = [
+        Entry(*row) for row in entries.order_by(
+            '-pub_date', '-recipe_id'
+        ).values_list('pub_date', 'recipe_id')[:limit]
+    ]
+    celebrities = list(Follow.objects.filter(
+        user=user, author__followers_count__gt=settings.FEED_FAN_OUT_LIMIT
+    ).values_list('author_id', flat=True))
+    if not celebrities:
+        return rows
+    recipes = before(
+        Recipe.objects.filter(author_id__in=celebrities), 'id', cursor
+    ).order_by('-pub_date', '-id').values_list('pub_date', 'id')[:limit]
+    return sorted(
+        set(rows).union(Entry(*row) for row in recipes), reverse=True
+    )[:limit]
+
+
+def rebuild(batch_size=1000):
+    """Пересобирает ленты всех пользователей по текущим подпискам."""
+    FeedEntry.objects.all().delete()
+    follows = Follow.objects.exclude(
+        author__followers_count__gt=settings.FEED_FAN_OUT_LIMIT
+    ).order_by('author_id', 'user_id').values_list('author_id', 'user_id')
+    total = 0
+    for author_id, group in groupby(
+        follows.iterator(batch_size), key=itemgetter(0)
+    ):
+        recipes = latest_recipes(author_id)
+        user_ids = [user_id for _, user_id in group]
+        for start in range(0, len(user_ids), batch_size):
+            insert(user_ids[start:start + batch_size], recipes)
+        total += len(user_ids) * len(recipes)
+    return total
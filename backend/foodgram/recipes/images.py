@@ -0,0 +1,204 @@
+"""Изображения рецептов и их превью в фоне.
+
+Запрос декодирует и проверяет загрузку целиком (её размер ограничен
+DATA_UPLOAD_MAX_MEMORY_SIZE) и сохраняет исходник, так что ссылка на
+изображение работает сразу. После коммита задача в пуле потоков создаёт
+превью и удаляет превью прежнего изображения. Если превью создать не
+удалось, рецепт помечается как обработанный с ошибкой и отдаёт исходник.
+
+Очередь живёт в памяти воркера. При плановом перезапуске (max_requests)
+воркер дожидается начатых задач в пределах graceful_timeout, а задачи,
+потерянные при аварийной остановке, подбирает generate_image_variants:
+рецепт без превью своего изображения обрабатывается заново.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from pathlib import PurePosixPath
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+variants_ready = Signal()
+
+FORMATS = (
+    ('webp', 'WEBP'),
+    ('jpeg', 'JPEG'),
+)
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+
+def sniff_extension(head):
+    """Расширение по первым байтам файла или None."""
+    for signature, extension in SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def verify(data):
+    """Расширение изображения из data; ValueError, если это не оно."""
+    extension = sniff_extension(data[:16])
+    if extension is None:
+        raise ValueError('Неизвестный формат изображения')
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image.verify()
+    except Exception as error:
+        raise ValueError('Повреждённое изображение') from error
+    return extension
+
+
+def store_upload(data, extension):
+    """Сохраняет проверенный исходник; возвращает его имя."""
+    return default_storage.save(
+        f'recipe_image/{uuid4().hex}.{extension}', ContentFile(data)
+    )
+
+
+def variant_formats(variants):
+    """Превью из image_variants без служебных ключей source и failed."""
+    return {
+        variant: formats for variant, formats in variants.items()
+        if isinstance(formats, dict)
+    }
+
+
+def variant_names(variants):
+    return {
+        name
+        for formats in variant_formats(variants).values()
+        for name in formats.values()
+    }
+
+
+def delete_variants(variants, keep=()):
+    for name in variant_names(variants) - set(keep):
+        default_storage.delete(name)
+
+
+def save_variants(recipe_id, name, variants):
+    """Записывает превью, если у рецепта всё ещё изображение name.
+
+    Превью прежнего изображения удаляются, а превью, которые опоздали
+    (рецепт удалён или изображение сменилось), — сразу.
+    """
+    with transaction.atomic():
+        old = Recipe.objects.select_for_update().filter(
+            pk=recipe_id, image=name
+        ).values_list('image_variants', flat=True).first()
+        if old is not None:
+            Recipe.objects.filter(pk=recipe_id).update(
+                image_variants=variants
+            )
+    if old is None:
+        delete_variants(variants)
+        return False
+    delete_variants(old, keep=variant_names(variants))
+    return True
+
+
+def mark_failed(recipe_id, name):
+    """Запоминает, что превью для name создать не удалось.
+
+    Рецепт отдаёт исходник, а generate_image_variants не повторяет
+    попытку без --force.
+    """
+    save_variants(recipe_id, name, {'source': name, 'failed': True})
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    return ThreadPoolExecutor(
+        max_workers=settings.RECIPE_IMAGE_WORKERS,
+        thread_name_prefix='recipe-images',
+    )
+
+
+def needs_variants(recipe):
+    return bool(recipe.image) and (
+        recipe.image_variants.get('source') != recipe.image.name
+    )
+
+
+def schedule_variants(recipe):
+    """Ставит генерацию превью в очередь после коммита транзакции."""
+    if not needs_variants(recipe):
+        return
+    args = recipe.pk, recipe.image.name
+    if settings.RECIPE_IMAGE_ASYNC:
+        transaction.on_commit(
+            lambda: get_executor().submit(run_in_worker, *args)
+        )
+    else:
+        transaction.on_commit(lambda: process(*args))
+
+
+def delete_files(recipe):
+    """Превью удалённого рецепта."""
+    variants = recipe.image_variants
+    transaction.on_commit(lambda: delete_variants(variants))
+
+
+def process(recipe_id, name):
+    try:
+        generate_variants(recipe_id, name)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+        mark_failed(recipe_id, name)
+
+
+def run_in_worker(recipe_id, name):
+    try:
+        process(recipe_id, name)
+    finally:
+        connection.close()
+
+
+def generate_variants(recipe_id, name):
+    with default_storage.open(name) as file:
+        image = Image.open(file)
+        image.load()
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    stem = PurePosixPath(name).stem
+    variants = {'source': name}
+    total = 0
+    for variant, size in settings.RECIPE_IMAGE_VARIANTS.items():
+        resized = image.copy()
+        resized.thumbnail(size)
+        variants[variant] = {}
+        for extension, image_format in FORMATS:
+            buffer = BytesIO()
+            resized.save(
+                buffer, image_format,
+                quality=settings.RECIPE_IMAGE_QUALITY, optimize=True
+            )
+            total += buffer.tell()
+            variants[variant][extension] = default_storage.save(
+                f'recipe_image/variants/{stem}_{variant}.{extension}',
+                ContentFile(buffer.getvalue()),
+            )
+    if save_variants(recipe_id, name, variants):
+        variants_ready.send(sender=Recipe, recipe_id=recipe_id)
+    logger.info(
+        'Превью для %s: исходник %s байт, превью %s байт',
+        name, default_storage.size(name), total
+    )
+    return variants
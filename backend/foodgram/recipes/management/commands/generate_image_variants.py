@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_variants, mark_failed, needs_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт превью изображений для рецептов, у которых их нет, в том '
+        'числе для задач, потерянных воркером.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help=(
+                'Пересоздать превью для всех рецептов, в том числе тех, '
+                'где прежняя попытка закончилась ошибкой.'
+            )
+        )
+
+    def handle(self, *args, **options):
+        done = failed = 0
+        for recipe in Recipe.objects.only('id', 'image', 'image_variants'):
+            if not options['force'] and not needs_variants(recipe):
+                continue
+            try:
+                generate_variants(recipe.pk, recipe.image.name)
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'{recipe.image.name}: {error}')
+                mark_failed(recipe.pk, recipe.image.name)
+                continue
+            done += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано: {done}, ошибок: {failed}'
+        ))
@@ -0,0 +1,135 @@
+import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.catalogue import catalogue
+from recipes.models import Ingredient
+
+DEFAULT_PATH = settings.BASE_DIR / 'data' / 'ingredients.csv'
+CHUNK_SIZE = 64 * 1024
+SEPARATORS = frozenset(' \t\r\n,[')
+
+
+def read_csv(path):
+    with open(path, encoding='utf-8', newline='') as file:
+        rows = csv.reader(file)
+        for row in rows:
+            if not row:
+                continue
+            if len(row) < 2:
+                raise CommandError(
+                    f'{path}, строка {rows.line_num}: нужны название и '
+                    f'единица измерения.'
+                )
+            yield None, row[0].strip(), row[1].strip()
+
+
+def read_json(path):
+    """Разбирает массив фикстур по одному объекту, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
+    with open(path, encoding='utf-8') as file:
+        while True:
+            while position < len(buffer) and buffer[position] in SEPARATORS:
+                position += 1
+            if buffer[position:position + 1] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    if position < len(buffer):
+                        raise CommandError(f'Некорректный JSON в {path}')
+                    return
+                chunk = file.read(CHUNK_SIZE)
+                eof = not chunk
+                buffer, position = buffer[position:] + chunk, 0
+                continue
+            fields = item.get('fields', item)
+            yield (
+                item.get('pk'),
+                fields['name'].strip(),
+                fields['measurement_unit'].strip(),
+            )
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV или JSON пакетами.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=str(DEFAULT_PATH))
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--update', action='store_true',
+            help=(
+                'Обновлять существующие записи по pk из JSON-фикстуры '
+                'вместо пропуска; pk нужен у каждой записи.'
+            )
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только .csv и .json файлы.')
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть >= 1.')
+        if options['update'] and reader is not read_json:
+            raise CommandError('--update работает только с JSON-фикстурой.')
+
+        rows = reader(path)
+        total = 0
+        start = time.perf_counter()
+        while True:
+            batch = [
+                Ingredient(id=pk, name=name, measurement_unit=unit)
+                for pk, name, unit in islice(rows, options['batch_size'])
+            ]
+            if not batch:
+                break
+            if options['update']:
+                self.check_pks(batch, total)
+            self.save(batch, options['update'])
+            total += len(batch)
+        elapsed = time.perf_counter() - start
+        # bulk_create не шлёт сигналов, а воркеры сверяют версию справочника.
+        catalogue.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {total} за {elapsed:.2f} с '
+            f'({total / elapsed if elapsed else 0:.0f} строк/с), '
+            f'ингредиентов в базе: {Ingredient.objects.count()}'
+        ))
+
+    def check_pks(self, batch, offset):
+        for number, ingredient in enumerate(batch, offset + 1):
+            if ingredient.id is None:
+                raise CommandError(
+                    f'Запись {number} без pk: --update обновляет '
+                    f'ингредиенты по pk.'
+                )
+
+    def save(self, batch, update):
+        if update:
+            Ingredient.objects.bulk_create(
+                batch,
+                update_conflicts=True,
+                unique_fields=('id',),
+                update_fields=('name', 'measurement_unit'),
+            )
+            return
+        for ingredient in batch:
+            ingredient.id = None
+        Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
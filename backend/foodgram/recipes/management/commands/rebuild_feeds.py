@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from recipes import feed
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает ленты подписок по текущим подпискам. Нужен после '
+        'импорта данных в обход API или смены FEED_FAN_OUT_LIMIT.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = feed.rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей в лентах: {total}'
+        ))
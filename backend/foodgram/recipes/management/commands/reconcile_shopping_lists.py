@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import shopping_list
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет материализованные списки покупок с корзинами и '
+        'пересобирает их.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить, не изменяя данные.'
+        )
+
+    def handle(self, *args, **options):
+        expected = shopping_list.expected_totals()
+        stored = shopping_list.stored_totals()
+        mismatches = [
+            key for key in expected.keys() | stored.keys()
+            if expected.get(key) != stored.get(key)
+        ]
+        for user_id, ingredient_id in sorted(mismatches)[:20]:
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'ожидалось {expected.get((user_id, ingredient_id), 0)}, '
+                f'в таблице {stored.get((user_id, ingredient_id), 0)}'
+            )
+        if options['check']:
+            if mismatches:
+                raise CommandError(f'Расхождений: {len(mismatches)}')
+            self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+            return
+        shopping_list.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено расхождений: {len(mismatches)}, '
+            f'строк в списках: {len(expected)}'
+        ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from recipes import trending
+
+
+class Command(BaseCommand):
+    help = (
+        'Обновляет рейтинг популярности рецептов по новым добавлениям в '
+        'избранное и корзину. Запускается периодически, например из cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать рейтинг с нуля с учётом удалений.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = trending.refresh(options['full'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлён рейтинг рецептов: {updated}'
+        ))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет счётчики избранного, рецептов и подписчиков с данными '
+        'и пересчитывает их.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить, не изменяя данные.'
+        )
+
+    def handle(self, *args, **options):
+        mismatches = counters.mismatches()
+        for (label, field), wrong in sorted(mismatches.items()):
+            self.stdout.write(f'{label}.{field}: неверно в {wrong} строках')
+        if options['check']:
+            if mismatches:
+                raise CommandError(
+                    f'Расхождений: {sum(mismatches.values())}'
+                )
+            self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+            return
+        counters.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено строк: {sum(mismatches.values())}'
+        ))
@@ -0,0 +1,139 @@
+import random
+from io import StringIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from recipes import counters, feed, search, shopping_list, trending
+from recipes.models import (Cart, Favorites, Ingredient, Recipe,
+                            RecipeIngredient, Tag)
+from users.models import Follow, User
+
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими данными для бенчмарков.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=500)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Избранных рецептов на пользователя.')
+        parser.add_argument('--cart', type=int, default=10,
+                            help='Рецептов в корзине на пользователя.')
+        parser.add_argument('--follows', type=int, default=10,
+                            help='Подписок на пользователя.')
+        parser.add_argument('--seed', type=int, default=42)
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        tags = self.seed_tags()
+        ingredient_ids = self.seed_ingredients()
+        users = self.seed_users(options['users'])
+        recipes = self.seed_recipes(
+            rnd, users, options['recipes'], tags,
+            ingredient_ids, options['ingredients_per_recipe']
+        )
+        self.seed_relations(rnd, users, recipes, options)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пользователей: {len(users)}, рецептов: {len(recipes)}, '
+            f'ингредиентов: {len(ingredient_ids)}'
+        ))
+
+    def seed_tags(self):
+        for name, color, slug in TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color}
+            )
+        return list(Tag.objects.all())
+
+    def seed_ingredients(self):
+        if not Ingredient.objects.exists():
+            call_command('load_ingredients', stdout=StringIO())
+        return list(Ingredient.objects.values_list('id', flat=True))
+
+    def seed_users(self, count):
+        start = User.objects.count()
+        password = make_password('benchmark')
+        User.objects.bulk_create(
+            User(
+                email=f'bench{number}@foodgram.ru',
+                username=f'bench{number}',
+                first_name='Бенч',
+                last_name=f'Марк{number}',
+                password=password,
+            )
+            for number in range(start, start + count)
+        )
+        return list(User.objects.all())
+
+    def seed_recipes(self, rnd, users, count, tags, ingredient_ids,
+                     per_recipe):
+        start = Recipe.objects.count()
+        last_id = Recipe.objects.aggregate(Max('id'))['id__max'] or 0
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=rnd.choice(users),
+                name=f'Рецепт {number}',
+                image='recipe_image/seed.png',
+                text=f'Описание рецепта {number}',
+                cooking_time=rnd.randint(1, 180),
+            )
+            for number in range(start, start + count)
+        )
+        recipes = list(Recipe.objects.filter(id__gt=last_id))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag.id)
+            for recipe in recipes
+            for tag in rnd.sample(tags, rnd.randint(1, len(tags)))
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id,
+                amount=rnd.randint(1, 500),
+            )
+            for recipe in recipes
+            for ingredient_id in rnd.sample(
+                ingredient_ids, min(per_recipe, len(ingredient_ids))
+            )
+        )
+        return recipes
+
+    def seed_relations(self, rnd, users, recipes, options):
+        for model, option in ((Favorites, 'favorites'), (Cart, 'cart')):
+            model.objects.bulk_create(
+                (
+                    model(user=user, recipe=recipe)
+                    for user in users
+                    for recipe in rnd.sample(
+                        recipes, min(options[option], len(recipes))
+                    )
+                ),
+                ignore_conflicts=True,
+            )
+        shopping_list.rebuild()
+        Follow.objects.bulk_create(
+            (
+                Follow(user=user, author=author)
+                for user in users
+                for author in rnd.sample(
+                    users, min(options['follows'], len(users))
+                )
+                if author != user
+            ),
+            ignore_conflicts=True,
+        )
+        counters.rebuild()
+        trending.refresh(full=True)
+        search.rebuild()
+        feed.rebuild()
@@ -0,0 +1,308 @@
+from collections.abc import Sequence
+from itertools import chain, islice
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import RecipeIngredient
+
+MODES = ('all', 'any', 'missing')
+BYTE_BITS = tuple(
+    tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)
+)
+
+
+def bitmap(positions):
+    """Собирает битовую карту из номеров позиций за один проход."""
+    positions = list(positions)
+    if not positions:
+        return 0
+    data = bytearray(max(positions) // 8 + 1)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(data, 'little')
+
+
+def bits(value, reverse=False):
+    """Номера установленных битов за линейное от длины карты время."""
+    data = value.to_bytes((value.bit_length() + 7) // 8, 'little')
+    indexes = range(len(data) - 1, -1, -1) if reverse else range(len(data))
+    for index in indexes:
+        byte = data[index]
+        if byte:
+            base = index * 8
+            for bit in reversed(BYTE_BITS[byte]) if reverse else (
+                BYTE_BITS[byte]
+            ):
+                yield base + bit
+
+
+def add_to_counter(counter, value):
+    """Прибавляет по единице в позициях value к побитовому счётчику."""
+    carry = value
+    for index, digit in enumerate(counter):
+        counter[index], carry = digit ^ carry, digit & carry
+        if not carry:
+            return
+    counter.append(carry)
+
+
+def equal_to(counter, number, universe):
+    """Позиции universe, в которых значение счётчика равно number."""
+    if number >> len(counter):
+        return 0
+    for index, digit in enumerate(counter):
+        universe &= digit if number >> index & 1 else ~digit
+    return universe
+
+
+class MatchResult(Sequence):
+    """Ленивый список (id рецепта, совпало, не хватает).
+
+    Хранит группы рецептов с одинаковыми числами совпадений как битовые
+    карты, так что подсчёт и нарезка страницы не перебирают все
+    найденные рецепты.
+    """
+
+    def __init__(self, groups, ids):
+        self._groups = sorted(
+            groups, key=lambda group: (group[0], -group[1])
+        )
+        self._ids = ids
+        self._length = sum(group[3] for group in self._groups)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._slice(*index.indices(self._length)[:2])
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        return self._slice(index, index + 1)[0]
+
+    def __iter__(self):
+        return self._rows(self._groups)
+
+    def _rows(self, groups):
+        for missing, matched, members, _ in groups:
+            for position in bits(members, True):
+                yield self._ids[position], matched, missing
+
+    def _slice(self, start, stop):
+        skipped = 0
+        groups = iter(self._groups)
+        for group in groups:
+            if skipped + group[3] > start:
+                break
+            skipped += group[3]
+        else:
+            return []
+        rows = self._rows(chain((group,), groups))
+        return list(islice(rows, start - skipped, max(start, stop) - skipped))
+
+
+class MatchData:
+    """Битовые карты одного построения индекса.
+
+    Ингредиентам выдаются плотные номера битов в порядке появления,
+    поэтому размер маски рецепта зависит от числа разных ингредиентов
+    в индексе, а не от величины их id.
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.positions = {}
+        self.masks = []
+        self.postings = {}
+        self.sizes = {}
+        self.ingredient_bits = {}
+        self.ingredient_ids = []
+
+    def ingredient_bit(self, ingredient_id):
+        if ingredient_id not in self.ingredient_bits:
+            self.ingredient_bits[ingredient_id] = len(self.ingredient_ids)
+            self.ingredient_ids.append(ingredient_id)
+        return self.ingredient_bits[ingredient_id]
+
+    def load(self, rows):
+        """Заполняет карты из пар (id рецепта, id ингредиента)."""
+        masks = {}
+        for recipe_id, ingredient_id in rows:
+            masks[recipe_id] = (
+                masks.get(recipe_id, 0) | 1 << self.ingredient_bit(
+                    ingredient_id
+                )
+            )
+        self.ids = list(masks)
+        self.positions = {
+            recipe_id: position for position, recipe_id in enumerate(self.ids)
+        }
+        self.masks = list(masks.values())
+        postings, sizes = {}, {}
+        for position, mask in enumerate(self.masks):
+            sizes.setdefault(mask.bit_count(), []).append(position)
+            for bit in bits(mask):
+                postings.setdefault(
+                    self.ingredient_ids[bit], []
+                ).append(position)
+        self.postings = {
+            ingredient_id: bitmap(positions)
+            for ingredient_id, positions in postings.items()
+        }
+        self.sizes = {
+            size: bitmap(positions) for size, positions in sizes.items()
+        }
+
+    def _unlink(self, position):
+        mask, bit = self.masks[position], 1 << position
+        if not mask:
+            return
+        for ingredient_bit in bits(mask):
+            self.postings[self.ingredient_ids[ingredient_bit]] &= ~bit
+        self.sizes[mask.bit_count()] &= ~bit
+        self.masks[position] = 0
+
+    def update(self, recipe_id, ingredient_ids):
+        position = self.positions.get(recipe_id)
+        if position is not None:
+            self._unlink(position)
+        if not ingredient_ids:
+            return
+        if position is None:
+            position = len(self.ids)
+            self.ids.append(recipe_id)
+            self.masks.append(0)
+            self.positions[recipe_id] = position
+        bit = 1 << position
+        mask = 0
+        for ingredient_id in ingredient_ids:
+            mask |= 1 << self.ingredient_bit(ingredient_id)
+            self.postings[ingredient_id] = (
+                self.postings.get(ingredient_id, 0) | bit
+            )
+        size = mask.bit_count()
+        self.sizes[size] = self.sizes.get(size, 0) | bit
+        self.masks[position] = mask
+
+    def groups(self, ingredient_ids, mode, max_missing):
+        counter = []
+        found = 0
+        for ingredient_id in ingredient_ids:
+            posting = self.postings.get(ingredient_id, 0)
+            add_to_counter(counter, posting)
+            found |= posting
+        total = len(ingredient_ids)
+        numbers = (total,) if mode == 'all' else range(1, total + 1)
+        for matched in numbers:
+            members = equal_to(counter, matched, found)
+            if not members:
+                continue
+            for size, sized in self.sizes.items():
+                missing = size - matched
+                if missing < 0 or mode == 'missing' and missing > max_missing:
+                    continue
+                group = sized & members
+                if group:
+                    yield missing, matched, group, group.bit_count()
+
+
+class RecipeMatchIndex:
+    """Битовый индекс «рецепт — ингредиенты» для подбора по продуктам.
+
+    Для каждого ингредиента хранится битовая карта позиций рецептов, для
+    каждого числа ингредиентов — карта рецептов такого размера. Число
+    совпадений считается побитовыми сложениями карт, поэтому ответ не
+    перебирает рецепты по одному. Индекс строится лениво, обновляется
+    сигналами в этом процессе и перестраивается по истечении
+    RECIPE_MATCH_INDEX_TTL.
+
+    Перестроение читает таблицу без блокировки индекса: пока оно идёт,
+    запросы отвечают по прежним картам, а изменения рецептов
+    запоминаются и применяются к новым картам перед подменой.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._build_lock = Lock()
+        self._data = None
+        self._pending = None
+        self._built_at = None
+
+    def invalidate(self):
+        with self._lock:
+            self._data = None
+            self._built_at = None
+
+    def _expired(self):
+        return (
+            self._built_at is None
+            or monotonic() - self._built_at > settings.RECIPE_MATCH_INDEX_TTL
+        )
+
+    def _build(self):
+        # Без готового индекса ждём построения, со старым — отвечаем по
+        # нему, пока его перестраивает другой поток.
+        if not self._build_lock.acquire(blocking=self._data is None):
+            return
+        try:
+            if not self._expired():
+                return
+            with self._lock:
+                self._pending = []
+            data = MatchData()
+            data.load(
+                RecipeIngredient.objects.order_by('recipe_id').values_list(
+                    'recipe_id', 'ingredient_id'
+                ).iterator(10_000)
+            )
+            with self._lock:
+                for recipe_id, ingredient_ids in self._pending:
+                    data.update(recipe_id, ingredient_ids)
+                self._data = data
+                self._built_at = monotonic()
+        finally:
+            with self._lock:
+                self._pending = None
+            self._build_lock.release()
+
+    def update(self, recipe_id, ingredient_ids):
+        """Заменяет ингредиенты рецепта; пустой список удаляет рецепт."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((recipe_id, ingredient_ids))
+            if self._data is not None:
+                self._data.update(recipe_id, ingredient_ids)
+
+    def reload(self, recipe_id):
+        if self._data is None and self._pending is None:
+            return
+        self.update(recipe_id, list(RecipeIngredient.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient_id', flat=True)))
+
+    def schedule(self, recipe_id):
+        transaction.on_commit(lambda: self.reload(recipe_id))
+
+    def match(self, ingredient_ids, mode='missing', max_missing=0):
+        """Рецепты с ингредиентами из ingredient_ids.
+
+        all — есть все перечисленные, any — хотя бы один, missing — не
+        хватает не больше max_missing ингредиентов рецепта. Первыми идут
+        рецепты, где не хватает меньше всего, затем с наибольшим числом
+        совпадений, затем более новые.
+        """
+        ingredient_ids = set(ingredient_ids)
+        if self._expired():
+            self._build()
+        with self._lock:
+            data = self._data
+            groups = list(data.groups(ingredient_ids, mode, max_missing))
+            return MatchResult(groups, data.ids)
+
+
+recipe_match_index = RecipeMatchIndex()
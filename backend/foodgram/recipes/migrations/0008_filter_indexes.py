@@ -0,0 +1,40 @@
+# Generated by Django 4.1.7 on 2026-10-18 16:55
+
+from django.db import migrations, models
+
+RECIPE_TAGS_INDEX = 'recipe_tags_tag_recipe_idx'
+
+
+def create_recipe_tags_index(apps, schema_editor):
+    through = apps.get_model('recipes', 'Recipe').tags.through
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {RECIPE_TAGS_INDEX} '
+        f'ON {through._meta.db_table} (tag_id, recipe_id)'
+    )
+
+
+def drop_recipe_tags_index(apps, schema_editor):
+    schema_editor.execute(f'DROP INDEX IF EXISTS {RECIPE_TAGS_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_pub_date_id_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['user', 'recipe'], name='cart_user_recipe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='favorites',
+            index=models.Index(fields=['user', 'recipe'], name='favorites_user_recipe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.RunPython(create_recipe_tags_index, drop_recipe_tags_index),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.1.7 on 2026-10-18 18:36
+
+from django.db import migrations
+
+
+def create_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS ingredient_upper_name_prefix_idx '
+        'ON recipes_ingredient (UPPER(name) varchar_pattern_ops)'
+    )
+
+
+def drop_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'DROP INDEX IF EXISTS ingredient_upper_name_prefix_idx'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_feed'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ingredient',
+            name='ingredient_name_prefix_idx',
+        ),
+        migrations.RunPython(create_prefix_index, drop_prefix_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_ingredient_upper_name_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trendingcheckpoint',
+            name='pending',
+            field=models.JSONField(default=dict, help_text='id до last_id, которых не было при прошлом проходе, и время, когда их заметили.', verbose_name='Пропущенные id'),
+        ),
+    ]
@@ -10,6 +10,12 @@ class Ingredient(models.Model):
 
     class Meta:
         verbose_name = 'Ингредиент'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient_unit',
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -42,6 +48,12 @@ class Recipe(models.Model):
         verbose_name='Изображение',
         upload_to='recipe_image/'
     )
+    image_variants = models.JSONField(
+        'Превью изображения',
+        default=dict,
+        blank=True,
+        editable=False,
+    )
 
     text = models.TextField('Описание', max_length=1000)
 
@@ -64,9 +76,48 @@ class Recipe(models.Model):
 
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
 
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False,
+    )
+    trending_score = models.FloatField(
+        'Рейтинг популярности',
+        default=0,
+        editable=False,
+    )
+    search_document = models.TextField(
+        'Поисковый документ',
+        blank=True,
+        default='',
+        editable=False,
+    )
+
     class Meta:
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
         verbose_name = 'Рецепт'
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx',
+            ),
+            models.Index(
+                fields=('author', '-pub_date'),
+                name='recipe_author_pub_date_idx',
+            ),
+            models.Index(
+                fields=('-favorites_count', '-id'),
+                name='recipe_popular_idx',
+            ),
+            models.Index(
+                fields=('-trending_score', '-id'),
+                name='recipe_trending_idx',
+            ),
+            models.Index(
+                fields=('cooking_time', 'id'),
+                name='recipe_cooking_time_idx',
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -102,10 +153,17 @@ class Cart(models.Model):
         verbose_name='Пользователь',
         related_name='cart',
     )
+    created = models.DateTimeField('Добавлено', auto_now_add=True)
 
     class Meta:
         verbose_name = 'Рецепт в корзине'
         unique_together = ('recipe', 'user')
+        indexes = (
+            models.Index(
+                fields=('user', 'recipe'),
+                name='cart_user_recipe_idx',
+            ),
+        )
 
 
 class Favorites(models.Model):
@@ -121,7 +179,125 @@ class Favorites(models.Model):
         verbose_name='Пользователь',
         related_name='favorites',
     )
+    created = models.DateTimeField('Добавлено', auto_now_add=True)
 
     class Meta:
         verbose_name = 'Рецепты в избранном'
         unique_together = ('recipe', 'user')
+        indexes = (
+            models.Index(
+                fields=('user', 'recipe'),
+                name='favorites_user_recipe_idx',
+            ),
+        )
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_list',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='+',
+    )
+    total_amount = models.IntegerField('Количество')
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item',
+            ),
+        )
+
+
+class TrendingCheckpoint(models.Model):
+    source = models.CharField('Источник событий', max_length=32, unique=True)
+    last_id = models.PositiveBigIntegerField('Последнее событие', default=0)
+    pending = models.JSONField(
+        'Пропущенные id',
+        default=dict,
+        help_text='id до last_id, которых не было при прошлом проходе, '
+                  'и время, когда их заметили.',
+    )
+
+    class Meta:
+        verbose_name = 'Отметка пересчёта популярности'
+
+    def __str__(self):
+        return f'{self.source}: {self.last_id}'
+
+
+class SearchPosting(models.Model):
+    term = models.CharField('Основа слова', max_length=64)
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='+',
+    )
+    weight = models.FloatField('Вес')
+
+    class Meta:
+        verbose_name = 'Запись поискового индекса'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('term', 'recipe'),
+                name='unique_search_posting',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.term}: {self.recipe_id}'
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик',
+        related_name='feed',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+        related_name='+',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Автор',
+        related_name='+',
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_entry',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='feed_user_pub_date_idx',
+            ),
+            models.Index(
+                fields=('user', 'author'),
+                name='feed_user_author_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user_id}: {self.recipe_id}'
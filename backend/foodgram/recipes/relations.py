@@ -0,0 +1,85 @@
+"""Идемпотентные избранное, корзина и подписки.
+
+Каждое добавление или удаление — одна команда на всю пачку id (см.
+bulk), а счётчики, списки покупок и ленты обновляются только по строкам,
+которые она действительно вставила или удалила. Повтор запроса или
+параллельный двойной клик ничего не меняют второй раз и не падают на
+уникальном ключе. Сигналы post_save/post_delete здесь не срабатывают,
+поэтому их работа выполняется явно.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from users.models import Follow, User
+
+from . import bulk, counters, feed, shopping_list
+from .models import Cart, Favorites, Recipe
+
+
+def changed(model, user, recipe_ids, delta):
+    if not recipe_ids:
+        return
+    if model is Favorites:
+        counters.change_many(Recipe, 'favorites_count', recipe_ids, delta)
+    elif delta > 0:
+        shopping_list.add_recipes(user.id, recipe_ids)
+    else:
+        shopping_list.remove_recipes(user.id, recipe_ids)
+
+
+@transaction.atomic
+def add(model, user, recipe_ids):
+    """Добавляет рецепты в избранное или корзину; возвращает новые id."""
+    now = timezone.now()
+    added = bulk.insert(
+        model, ('user', 'recipe', 'created'),
+        ((user.id, recipe_id, now) for recipe_id in recipe_ids),
+        returning='recipe',
+    )
+    changed(model, user, added, 1)
+    return added
+
+
+@transaction.atomic
+def remove(model, user, recipe_ids):
+    """Убирает рецепты из избранного или корзины; возвращает удалённые id."""
+    removed = bulk.delete(
+        model, 'recipe', user=user.id, recipe__in=recipe_ids
+    )
+    changed(model, user, removed, -1)
+    return removed
+
+
+@transaction.atomic
+def favorites_to_cart(user):
+    """Кладёт в корзину всё избранное одной командой INSERT ... SELECT."""
+    added = bulk.insert_from(
+        Cart, ('user', 'recipe', 'created'),
+        Favorites, ('user', 'recipe', (timezone.now(),)),
+        returning='recipe', user=user.id,
+    )
+    changed(Cart, user, added, 1)
+    return added
+
+
+@transaction.atomic
+def follow(user, author):
+    """Подписывает user на author; False, если подписка уже была."""
+    if not bulk.insert(
+        Follow, ('user', 'author'), ((user.id, author.id),),
+        returning='author',
+    ):
+        return False
+    counters.change(User, 'followers_count', author.id, 1)
+    feed.schedule_backfill(user.id, author.id)
+    return True
+
+
+@transaction.atomic
+def unfollow(user, author):
+    """Отписывает user от author; False, если подписки не было."""
+    if not bulk.delete(Follow, 'author', user=user.id, author=author.id):
+        return False
+    counters.change(User, 'followers_count', author.id, -1)
+    feed.unfollow(user.id, author.id)
+    return True
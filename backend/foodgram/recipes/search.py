@@ -0,0 +1,160 @@
+"""Полнотекстовый поиск рецептов по названию, описанию и ингредиентам.
+
+На PostgreSQL запрос идёт по GIN-индексу над to_tsvector('russian',
+search_document). На остальных СУБД используется собственный обратный
+индекс SearchPosting: основы слов (Snowball) с весами по полям.
+Документ и индекс обновляются после сохранения рецепта.
+"""
+import math
+import re
+from functools import lru_cache
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection, transaction
+from django.db.models import (Case, Count, F, FloatField, OuterRef, Prefetch,
+                              Subquery, Sum, Value, When)
+from snowballstemmer import stemmer
+
+from .models import Recipe, RecipeIngredient, SearchPosting
+
+CONFIG = 'russian'
+FIELD_WEIGHTS = {'name': 3.0, 'ingredients': 2.0, 'text': 1.0}
+TOKEN = re.compile(r'\w+')
+CYRILLIC = re.compile('[а-я]')
+MAX_TERM_LENGTH = SearchPosting._meta.get_field('term').max_length
+
+
+@lru_cache(maxsize=None)
+def get_stemmer(language):
+    return stemmer(language)
+
+
+@lru_cache(maxsize=100_000)
+def stem(word):
+    language = 'russian' if CYRILLIC.search(word) else 'english'
+    return get_stemmer(language).stemWord(word)[:MAX_TERM_LENGTH]
+
+
+def terms(text):
+    return [
+        stem(word) for word in TOKEN.findall(text.lower().replace('ё', 'е'))
+    ]
+
+
+def use_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def recipe_fields(recipe):
+    return {
+        'name': recipe.name,
+        'ingredients': ' '.join(
+            item.ingredient.name for item in recipe.search_ingredients
+        ),
+        'text': recipe.text,
+    }
+
+
+def postings(recipe, fields):
+    weights = {}
+    for field, text in fields.items():
+        for term in terms(text):
+            weights[term] = weights.get(term, 0) + FIELD_WEIGHTS[field]
+    return [
+        SearchPosting(term=term, recipe=recipe, weight=weight)
+        for term, weight in weights.items()
+    ]
+
+
+@transaction.atomic
+def reindex(recipe_ids):
+    """Пересобирает поисковый документ и индекс для указанных рецептов."""
+    recipes = list(
+        Recipe.objects.filter(id__in=recipe_ids).only('id', 'name', 'text')
+        .prefetch_related(Prefetch(
+            'recipe',
+            queryset=RecipeIngredient.objects.select_related('ingredient'),
+            to_attr='search_ingredients',
+        ))
+    )
+    entries = []
+    for recipe in recipes:
+        fields = recipe_fields(recipe)
+        recipe.search_document = '\n'.join(fields.values())
+        if not use_postgres():
+            entries.extend(postings(recipe, fields))
+    Recipe.objects.bulk_update(recipes, ('search_document',))
+    if not use_postgres():
+        SearchPosting.objects.filter(recipe_id__in=recipe_ids).delete()
+        SearchPosting.objects.bulk_create(entries)
+    return len(recipes)
+
+
+def rebuild(batch_size=500):
+    recipe_ids = list(
+        Recipe.objects.order_by('id').values_list('id', flat=True)
+    )
+    for start in range(0, len(recipe_ids), batch_size):
+        reindex(recipe_ids[start:start + batch_size])
+    return len(recipe_ids)
+
+
+def schedule(recipe_id):
+    transaction.on_commit(lambda: reindex([recipe_id]))
+
+
+def schedule_ingredient(ingredient_id):
+    recipe_ids = list(RecipeIngredient.objects.filter(
+        ingredient_id=ingredient_id
+    ).values_list('recipe_id', flat=True).distinct())
+    if recipe_ids:
+        transaction.on_commit(lambda: reindex(recipe_ids))
+
+
+def search_postgres(queryset, value):
+    vector = SearchVector('search_document', config=CONFIG)
+    query = SearchQuery(value, config=CONFIG)
+    return queryset.annotate(search_vector=vector).filter(
+        search_vector=query
+    ).annotate(search_rank=SearchRank(vector, query))
+
+
+def search_postings(queryset, value):
+    query_terms = set(terms(value))
+    total = Recipe.objects.count()
+    frequencies = SearchPosting.objects.filter(
+        term__in=query_terms
+    ).values_list('term').annotate(df=Count('id'))
+    idf = Case(
+        *(
+            When(term=term, then=Value(math.log(1 + total / df)))
+            for term, df in frequencies
+        ),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    matches = SearchPosting.objects.filter(
+        term__in=query_terms
+    ).values('recipe').annotate(matched=Count('id')).filter(
+        matched=len(query_terms)
+    ).values('recipe')
+    rank = SearchPosting.objects.filter(
+        recipe=OuterRef('pk'), term__in=query_terms
+    ).values('recipe').annotate(
+        rank=Sum(F('weight') * idf)
+    ).values('rank')
+    return queryset.filter(pk__in=matches).annotate(
+        search_rank=Subquery(rank, output_field=FloatField())
+    )
+
+
+def search(queryset, value):
+    """Оставляет рецепты со всеми словами запроса по убыванию search_rank."""
+    if not terms(value):
+        return queryset.none()
+    if use_postgres():
+        queryset = search_postgres(queryset, value)
+    else:
+        queryset = search_postings(queryset, value)
+    return queryset.order_by('-search_rank', '-id')
@@ -0,0 +1,144 @@
+"""Материализованные списки покупок, обновляемые на разницу.
+
+Выгрузка списка читает готовые строки ShoppingListItem без агрегации.
+Изменения корзины, рецептов и их ингредиентов через ORM (в том числе в
+админке и каскадом) применяются сигналами, а массовые операции без
+сигналов (relations, обновление рецепта через API) вызывают функции
+модуля сами.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Sum
+
+from . import bulk
+from .models import Cart, RecipeIngredient, ShoppingListItem
+
+
+def recipe_amounts(recipe):
+    return recipes_amounts((recipe,))
+
+
+def recipes_amounts(recipes):
+    amounts = Counter()
+    for ingredient_id, amount in RecipeIngredient.objects.filter(
+        recipe__in=recipes
+    ).values_list('ingredient_id', 'amount'):
+        amounts[ingredient_id] += amount
+    return amounts
+
+
+def upsert_clause():
+    total = bulk.column(ShoppingListItem, 'total_amount')
+    return (
+        f'({bulk.column(ShoppingListItem, "user")}, '
+        f'{bulk.column(ShoppingListItem, "ingredient")}) '
+        f'DO UPDATE SET {total} = '
+        f'{bulk.table(ShoppingListItem)}.{total} + excluded.{total}'
+    )
+
+
+@transaction.atomic
+def apply(user_ids, deltas):
+    """Прибавляет deltas к спискам пользователей.
+
+    Позиции вставляются и увеличиваются одной командой INSERT ... ON
+    CONFLICT DO UPDATE, поэтому параллельные изменения одного списка не
+    сталкиваются на уникальном ключе.
+    """
+    user_ids = list(user_ids)
+    deltas = {
+        ingredient_id: delta
+        for ingredient_id, delta in deltas.items() if delta
+    }
+    if not user_ids or not deltas:
+        return
+    bulk.insert(
+        ShoppingListItem, ('user', 'ingredient', 'total_amount'),
+        (
+            (user_id, ingredient_id, delta)
+            for user_id in user_ids
+            for ingredient_id, delta in deltas.items()
+        ),
+        conflict=upsert_clause(),
+    )
+    ShoppingListItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=deltas, total_amount__lte=0
+    ).delete()
+
+
+def add_recipe(user_id, recipe_id):
+    add_recipes(user_id, (recipe_id,))
+
+
+def remove_recipe(user_id, recipe_id):
+    remove_recipes(user_id, (recipe_id,))
+
+
+def add_recipes(user_id, recipes):
+    apply((user_id,), recipes_amounts(recipes))
+
+
+def remove_recipes(user_id, recipes):
+    apply(
+        (user_id,),
+        {id: -amount for id, amount in recipes_amounts(recipes).items()}
+    )
+
+
+def change_recipe(recipe, old_amounts, new_amounts):
+    deltas = {
+        ingredient_id: (
+            new_amounts.get(ingredient_id, 0)
+            - old_amounts.get(ingredient_id, 0)
+        )
+        for ingredient_id in old_amounts.keys() | new_amounts.keys()
+    }
+    if any(deltas.values()):
+        apply(
+            Cart.objects.filter(recipe=recipe).values_list(
+                'user_id', flat=True
+            ),
+            deltas
+        )
+
+
+def delete_recipe(recipe):
+    change_recipe(recipe, recipe_amounts(recipe), {})
+
+
+def expected_totals():
+    return {
+        (row['recipe__in_cart__user'], row['ingredient']): row['total']
+        for row in RecipeIngredient.objects.filter(
+            recipe__in_cart__isnull=False
+        ).values(
+            'recipe__in_cart__user', 'ingredient'
+        ).annotate(total=Sum('amount')).order_by().iterator()
+    }
+
+
+def stored_totals():
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in (
+            ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'total_amount'
+            ).iterator()
+        )
+    }
+
+
+@transaction.atomic
+def rebuild():
+    ShoppingListItem.objects.all().delete()
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(
+                user_id=user_id, ingredient_id=ingredient_id,
+                total_amount=total
+            )
+            for (user_id, ingredient_id), total in expected_totals().items()
+        ),
+        batch_size=1000,
+    )
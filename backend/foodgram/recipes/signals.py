@@ -0,0 +1,161 @@
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from users.models import Follow, User
+
+from . import counters, feed, search, shopping_list
+from .catalogue import catalogue
+from .images import delete_files, schedule_variants
+from .matching import recipe_match_index
+from .models import Cart, Favorites, Ingredient, Recipe, RecipeIngredient, Tag
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_catalogue(**kwargs):
+    transaction.on_commit(catalogue.invalidate)
+
+
+@receiver(post_save, sender=Ingredient)
+def reindex_ingredient_recipes(instance, created, **kwargs):
+    if not created:
+        search.schedule_ingredient(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def generate_image_variants(instance, **kwargs):
+    schedule_variants(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def delete_image_files(instance, **kwargs):
+    delete_files(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def reindex_recipe(instance, **kwargs):
+    search.schedule(instance.pk)
+    recipe_match_index.schedule(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def drop_from_match_index(instance, **kwargs):
+    recipe_match_index.update(instance.pk, ())
+
+
+@receiver(post_save, sender=Favorites)
+def favorite_added(instance, created, **kwargs):
+    if created:
+        counters.change(Recipe, 'favorites_count', instance.recipe_id, 1)
+
+
+@receiver(post_delete, sender=Favorites)
+def favorite_removed(instance, **kwargs):
+    counters.change(Recipe, 'favorites_count', instance.recipe_id, -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_added(instance, created, **kwargs):
+    if created:
+        counters.change(User, 'recipes_count', instance.author_id, 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_removed(instance, **kwargs):
+    counters.change(User, 'recipes_count', instance.author_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_added(instance, created, **kwargs):
+    if created:
+        counters.change(User, 'followers_count', instance.author_id, 1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_removed(instance, **kwargs):
+    counters.change(User, 'followers_count', instance.author_id, -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(instance, created, **kwargs):
+    if created:
+        feed.schedule(instance)
+
+
+@receiver(post_save, sender=Follow)
+def feed_followed(instance, created, **kwargs):
+    if created:
+        feed.schedule_backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def feed_unfollowed(instance, **kwargs):
+    feed.unfollow(instance.user_id, instance.author_id)
+
+
+def deleted_directly(origin, model):
+    """Удаление начато с объекта или QuerySet model, а не каскадом."""
+    return isinstance(origin, model) or getattr(origin, 'model', None) is model
+
+
+@receiver(pre_save, sender=Cart)
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_saved_row(sender, instance, **kwargs):
+    instance.saved_row = (
+        sender.objects.filter(pk=instance.pk).values().first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Cart)
+def cart_saved(instance, **kwargs):
+    old = instance.saved_row
+    if old is not None:
+        if (old['user_id'], old['recipe_id']) == (
+            instance.user_id, instance.recipe_id
+        ):
+            return
+        shopping_list.remove_recipe(old['user_id'], old['recipe_id'])
+    shopping_list.add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_delete, sender=Cart)
+def cart_deleted(instance, origin, **kwargs):
+    # Каскад от рецепта учтён в recipe_deleted, а от пользователя удаляет
+    # и сам список.
+    if deleted_directly(origin, Cart):
+        shopping_list.remove_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def recipe_ingredient_saved(instance, **kwargs):
+    old = instance.saved_row
+    old_amounts = {}
+    if old is not None:
+        if old['recipe_id'] != instance.recipe_id:
+            shopping_list.change_recipe(
+                old['recipe_id'], {old['ingredient_id']: old['amount']}, {}
+            )
+        else:
+            old_amounts[old['ingredient_id']] = old['amount']
+    shopping_list.change_recipe(
+        instance.recipe_id, old_amounts,
+        {instance.ingredient_id: instance.amount}
+    )
+
+
+@receiver(pre_delete, sender=RecipeIngredient)
+def recipe_ingredient_deleted(instance, origin, **kwargs):
+    # Каскад от рецепта учтён в recipe_deleted, а от ингредиента удаляет
+    # и позиции списков с ним.
+    if deleted_directly(origin, RecipeIngredient):
+        shopping_list.change_recipe(
+            instance.recipe_id, {instance.ingredient_id: instance.amount}, {}
+        )
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    shopping_list.delete_recipe(instance)
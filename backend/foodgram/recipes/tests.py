@@ -0,0 +1,301 @@
+import json
+from io import StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from users.models import Follow, User
+from . import counters, shopping_list, trending
+from .matching import MatchData, RecipeMatchIndex, bits
+from .models import (Cart, Favorites, Ingredient, Recipe, RecipeIngredient,
+                     TrendingCheckpoint)
+
+
+class ShoppingListSignalsTest(TestCase):
+    """Изменения через ORM, как в админке, сохраняют списки актуальными."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.buyer = (
+            User.objects.create_user(
+                email=f'{name}@example.com', username=name,
+                first_name=name, last_name=name, password='password',
+            )
+            for name in ('author', 'buyer')
+        )
+        cls.flour, cls.milk = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('мука', 'молоко')
+        )
+
+    def setUp(self):
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Блины', image='recipe_image/test.png',
+            text='Описание', cooking_time=20,
+        )
+        self.item = RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=self.flour, amount=200
+        )
+        self.cart = Cart.objects.create(user=self.buyer, recipe=self.recipe)
+        # Проверки удаления не зависят от сигнала добавления в корзину.
+        shopping_list.rebuild()
+
+    def assert_lists_consistent(self):
+        self.assertEqual(
+            shopping_list.stored_totals(), shopping_list.expected_totals()
+        )
+
+    def test_cart_added(self):
+        Cart.objects.create(user=self.author, recipe=self.recipe)
+        self.assertEqual(
+            shopping_list.stored_totals()[self.author.id, self.flour.id], 200
+        )
+
+    def test_recipe_ingredient_changed(self):
+        self.item.amount = 300
+        self.item.save()
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=self.milk, amount=500
+        )
+        self.assert_lists_consistent()
+        self.item.ingredient = self.milk
+        self.item.amount = 100
+        RecipeIngredient.objects.filter(ingredient=self.milk).delete()
+        self.item.save()
+        self.assert_lists_consistent()
+
+    def test_recipe_ingredient_deleted(self):
+        self.item.delete()
+        self.assert_lists_consistent()
+
+    def test_cart_deleted(self):
+        Cart.objects.filter(pk=self.cart.pk).delete()
+        self.assert_lists_consistent()
+
+    def test_recipe_deleted(self):
+        self.recipe.delete()
+        self.assert_lists_consistent()
+
+    def test_author_deleted(self):
+        self.author.delete()
+        self.assertEqual(shopping_list.stored_totals(), {})
+
+
+class RecipeMatchIndexTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='author', last_name='author', password='password',
+        )
+        cls.flour, cls.milk, cls.eggs = (
+            Ingredient.objects.create(
+                id=1_000_000 + number, name=name, measurement_unit='г'
+            )
+            for number, name in enumerate(('мука', 'молоко', 'яйца'))
+        )
+        cls.recipes = {}
+        for name, ingredients in (
+            ('Блины', (cls.flour, cls.milk, cls.eggs)),
+            ('Омлет', (cls.milk, cls.eggs)),
+        ):
+            recipe = cls.recipes[name] = Recipe.objects.create(
+                author=author, name=name, image='recipe_image/test.png',
+                text='Описание', cooking_time=20,
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=item, amount=1)
+                for item in ingredients
+            )
+
+    def test_masks_use_dense_bits(self):
+        index = RecipeMatchIndex()
+        result = index.match([self.milk.id, self.eggs.id])
+        self.assertEqual(
+            [row[0] for row in result], [self.recipes['Омлет'].id]
+        )
+        self.assertLessEqual(
+            max(mask.bit_length() for mask in index._data.masks), 3
+        )
+
+    def test_update_during_build_is_kept(self):
+        index = RecipeMatchIndex()
+        load = MatchData.load
+        omelette = self.recipes['Омлет'].id
+
+        def load_and_update(data, rows):
+            load(data, rows)
+            index.update(omelette, [self.flour.id])
+
+        with mock.patch.object(MatchData, 'load', load_and_update):
+            index.match([self.flour.id])
+        result = index.match([self.flour.id])
+        self.assertEqual([row[0] for row in result], [omelette])
+
+    def test_recipe_refilled_after_losing_all_ingredients(self):
+        data = MatchData()
+        data.load([(1, 10), (1, 11), (2, 10)])
+        data.update(1, [])
+        data.update(1, [10])
+        self.assertEqual(data.masks[data.positions[1]].bit_count(), 1)
+        self.assertEqual(
+            sorted(data.ids[position] for position in bits(
+                data.postings[10]
+            )),
+            [1, 2],
+        )
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader = (
+            User.objects.create_user(
+                email=f'{name}@example.com', username=name,
+                first_name=name, last_name=name, password='password',
+            )
+            for name in ('author', 'reader')
+        )
+
+    def create_recipe(self, name):
+        return Recipe.objects.create(
+            author=self.author, name=name, image='recipe_image/test.png',
+            text='Описание', cooking_time=20,
+        )
+
+    def assert_counts(self, recipe, favorites, recipes, followers):
+        if recipe is not None:
+            recipe.refresh_from_db()
+            self.assertEqual(recipe.favorites_count, favorites)
+        self.author.refresh_from_db()
+        self.assertEqual(
+            (self.author.recipes_count, self.author.followers_count),
+            (recipes, followers),
+        )
+
+    def test_counters_follow_creates_and_deletes(self):
+        recipe = self.create_recipe('Блины')
+        self.create_recipe('Каша')
+        Favorites.objects.create(user=self.reader, recipe=recipe)
+        Favorites.objects.create(user=self.author, recipe=recipe)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assert_counts(recipe, 2, 2, 1)
+        Favorites.objects.filter(user=self.reader).delete()
+        Follow.objects.all().delete()
+        self.assert_counts(recipe, 1, 2, 0)
+        recipe.delete()
+        self.assert_counts(None, 0, 1, 0)
+
+    def test_repair_counters(self):
+        recipe = self.create_recipe('Блины')
+        Favorites.objects.create(user=self.reader, recipe=recipe)
+        Recipe.objects.update(favorites_count=5)
+        User.objects.filter(pk=self.author.pk).update(recipes_count=0)
+        with self.assertRaises(CommandError):
+            call_command('repair_counters', '--check', stdout=StringIO())
+        call_command('repair_counters', stdout=StringIO())
+        self.assertEqual(counters.mismatches(), {})
+        self.assert_counts(recipe, 1, 1, 0)
+
+
+class TrendingRefreshTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                email=f'user{number}@example.com', username=f'user{number}',
+                first_name='user', last_name='user', password='password',
+            )
+            for number in range(3)
+        ]
+        cls.recipe = Recipe.objects.create(
+            author=cls.users[0], name='Блины',
+            image='recipe_image/test.png', text='Описание', cooking_time=20,
+        )
+
+    def score(self):
+        trending.refresh()
+        self.recipe.refresh_from_db()
+        return self.recipe.trending_score
+
+    def test_event_committed_out_of_order_is_counted_once(self):
+        first, late, last = (
+            Favorites.objects.create(user=user, recipe=self.recipe)
+            for user in self.users
+        )
+        late_id = late.id
+        # Строка с меньшим id ещё не закоммичена, когда идёт пересчёт.
+        Favorites.objects.filter(id=late_id).delete()
+        before = self.score()
+        self.assertEqual(
+            list(TrendingCheckpoint.objects.get(source='favorites').pending),
+            [str(late_id)],
+        )
+        Favorites.objects.create(
+            id=late_id, user=self.users[1], recipe=self.recipe
+        )
+        after = self.score()
+        self.assertGreater(after, before)
+        self.assertEqual(self.score(), after)
+        self.assertEqual(
+            TrendingCheckpoint.objects.get(source='favorites').pending, {}
+        )
+
+    def test_missing_ids_are_forgotten_after_timeout(self):
+        first, gone, last = (
+            Favorites.objects.create(user=user, recipe=self.recipe)
+            for user in self.users
+        )
+        gone.delete()
+        self.score()
+        with self.settings(TRENDING_PENDING_TIMEOUT=-1):
+            self.score()
+        self.assertEqual(
+            TrendingCheckpoint.objects.get(source='favorites').pending, {}
+        )
+
+
+class LoadIngredientsTest(TestCase):
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def load(self, name, content, *args):
+        path = self.directory / name
+        path.write_text(content, encoding='utf-8')
+        call_command('load_ingredients', str(path), *args, stdout=StringIO())
+
+    def test_csv_rows_are_loaded_once(self):
+        content = 'мука,г\nсоль,г\nмука,г\n'
+        self.load('ingredients.csv', content, '--batch-size', '2')
+        self.load('ingredients.csv', content)
+        self.assertEqual(
+            sorted(Ingredient.objects.values_list('name', 'measurement_unit')),
+            [('мука', 'г'), ('соль', 'г')],
+        )
+
+    def test_short_csv_row_is_reported_with_line(self):
+        with self.assertRaisesMessage(CommandError, 'строка 2'):
+            self.load('ingredients.csv', 'мука,г\nсоль\n')
+
+    def test_update_by_pk(self):
+        flour = Ingredient.objects.create(name='мука', measurement_unit='г')
+        self.load('ingredients.json', json.dumps([
+            {'pk': flour.id, 'fields': {
+                'name': 'мука', 'measurement_unit': 'кг'
+            }},
+        ]), '--update')
+        flour.refresh_from_db()
+        self.assertEqual(flour.measurement_unit, 'кг')
+
+    def test_update_requires_pk(self):
+        with self.assertRaisesMessage(CommandError, 'Запись 1 без pk'):
+            self.load('ingredients.json', json.dumps([
+                {'name': 'мука', 'measurement_unit': 'г'},
+            ]), '--update')
+        self.assertFalse(Ingredient.objects.exists())
@@ -0,0 +1,116 @@
+"""Рейтинг популярности рецептов с экспоненциальным затуханием.
+
+Каждое добавление в избранное или корзину весит weight * 2 ** (-age / T),
+где T — период полураспада. Общий множитель затухания одинаков для всех
+рецептов, поэтому в базе хранится log2 суммы весов, отсчитанных от
+фиксированной эпохи: порядок по нему совпадает с порядком по текущему
+рейтингу, значения растут линейно со временем и не требуют
+периодического пересчёта всей таблицы. Новые события добавляются к
+сохранённому значению через log2(2 ** a + 2 ** b).
+
+События читаются по возрастанию id от отметки прошлого запуска. Id
+выдаются до коммита, поэтому строка с меньшим id может появиться уже
+после того, как учтена строка с большим. Такие пропуски запоминаются в
+TrendingCheckpoint.pending и проверяются при следующих запусках, пока
+не пройдёт TRENDING_PENDING_TIMEOUT: за это время транзакция либо
+закоммичена, либо id не появится никогда (откат, удаление).
+"""
+import math
+from datetime import datetime, timezone
+from time import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Cart, Favorites, Recipe, TrendingCheckpoint
+
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+SOURCES = (
+    ('favorites', Favorites, 1.0),
+    ('cart', Cart, 0.5),
+)
+
+
+def event_score(created, weight):
+    half_life = settings.TRENDING_HALF_LIFE_HOURS * 3600
+    return math.log2(weight) + (created - EPOCH).total_seconds() / half_life
+
+
+def combine(first, second):
+    """log2(2 ** first + 2 ** second); ноль означает отсутствие событий."""
+    if not first:
+        return second
+    if not second:
+        return first
+    high, low = max(first, second), min(first, second)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def collect(model, weight, checkpoint, batch_size):
+    """Новые события после checkpoint и ранее пропущенные id.
+
+    Возвращает рейтинги по рецептам и обновляет last_id и pending.
+    """
+    now, limit = time(), settings.TRENDING_PENDING_LIMIT
+    last_id = checkpoint.last_id
+    pending = {
+        int(event_id): at for event_id, at in checkpoint.pending.items()
+    }
+    scores = {}
+    events = model.objects.filter(
+        Q(id__gt=last_id) | Q(id__in=pending)
+    ).order_by('id').values_list('id', 'recipe_id', 'created')
+    for event_id, recipe_id, created in events.iterator(batch_size):
+        scores[recipe_id] = combine(
+            scores.get(recipe_id, 0), event_score(created, weight)
+        )
+        if event_id in pending:
+            del pending[event_id]
+            continue
+        for missing in range(max(last_id + 1, event_id - limit), event_id):
+            pending[missing] = now
+        last_id = event_id
+    deadline = now - settings.TRENDING_PENDING_TIMEOUT
+    checkpoint.pending = {
+        str(event_id): at
+        for event_id, at in sorted(pending.items())[-limit:]
+        if at > deadline
+    }
+    checkpoint.last_id = last_id
+    return scores
+
+
+def store(scores, batch_size):
+    recipe_ids = list(scores)
+    for start in range(0, len(recipe_ids), batch_size):
+        recipes = Recipe.objects.filter(
+            id__in=recipe_ids[start:start + batch_size]
+        ).only('id', 'trending_score')
+        for recipe in recipes:
+            recipe.trending_score = combine(
+                recipe.trending_score, scores[recipe.id]
+            )
+        Recipe.objects.bulk_update(recipes, ('trending_score',))
+
+
+@transaction.atomic
+def refresh(full=False, batch_size=1000):
+    """Учитывает события, появившиеся после прошлого запуска.
+
+    Удаления из избранного и корзины не вычитаются; их учитывает только
+    полный пересчёт (full=True).
+    """
+    if full:
+        Recipe.objects.update(trending_score=0)
+        TrendingCheckpoint.objects.all().delete()
+    scores = {}
+    for source, model, weight in SOURCES:
+        checkpoint, _ = TrendingCheckpoint.objects.select_for_update(
+        ).get_or_create(source=source)
+        found = collect(model, weight, checkpoint, batch_size)
+        for recipe_id, score in found.items():
+            scores[recipe_id] = combine(scores.get(recipe_id, 0), score)
+        checkpoint.save(update_fields=('last_id', 'pending'))
+    store(scores, batch_size)
+    return len(scores)
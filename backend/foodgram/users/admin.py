@@ -3,5 +3,9 @@ from django.contrib import admin
 from .models import Follow, User
 
 
+class UserAdmin(admin.ModelAdmin):
+    list_display = ('email', 'username', 'recipes_count', 'followers_count')
+
+
 admin.site.register(Follow)
-admin.site.register(User)
+admin.site.register(User, UserAdmin)
@@ -0,0 +1,291 @@
+"""Нагрузочный тест API, запущенного через docker-compose.
+
+Для каждого профиля пересоздаёт контейнер backend с нужными
+DJANGO_PROFILE и SERVER_INTERFACE, ждёт готовности и в течение duration
+секунд опрашивает пути API из concurrency потоков с keep-alive
+соединениями. --slow-clients добавляет клиентов, которые передают
+заголовки запроса по байту: они занимают потоки синхронных воркеров, но
+не воркеры uvicorn. В конце печатает сравнение пропускной способности и
+задержек. Использует только стандартную библиотеку:
+
+    python load_test.py --profiles development production production:asgi
+    python load_test.py --profiles production production:asgi \
+        --slow-clients 32
+    python load_test.py --no-restart --url http://localhost:8000
+
+--mode toggle и --mode bulk вместо чтения добавляют и убирают рецепты
+из избранного и корзины от имени пользователя --token: toggle — по
+одному, каждое действие дважды подряд, как двойной клик, bulk — пачками
+и переносом избранного в корзину. Потоки работают с одними и теми же
+рецептами, поэтому запросы конкурируют; ошибкой считается только 5xx.
+После прогона согласованность проверяют repair_counters --check и
+reconcile_shopping_lists --check.
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import threading
+import time
+from itertools import cycle
+from urllib.parse import urlsplit
+
+DEFAULT_PATHS = (
+    '/api/recipes/',
+    '/api/recipes/?page=2',
+    '/api/recipes/?tags=breakfast&tags=lunch',
+    '/api/recipes/?ordering=popular',
+    '/api/tags/',
+    '/api/ingredients/?name=%D1%81%D0%BE',
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', default='http://localhost')
+    parser.add_argument(
+        '--profiles', nargs='+', default=['development', 'production'],
+        help='Профили вида <DJANGO_PROFILE>[:<SERVER_INTERFACE>].'
+    )
+    parser.add_argument('--compose-file', default='docker-compose_local.yml')
+    parser.add_argument('--no-restart', action='store_true',
+                        help='Не пересоздавать backend, тестировать как есть.')
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--path', action='append', dest='paths',
+                        help='Путь для опроса; можно указать несколько раз.')
+    parser.add_argument('--mode', choices=('read', 'toggle', 'bulk'),
+                        default='read')
+    parser.add_argument('--recipes', type=int, default=10,
+                        help='Сколько рецептов переключать в toggle и bulk.')
+    parser.add_argument('--slow-clients', type=int, default=0)
+    parser.add_argument('--slow-interval', type=float, default=0.2,
+                        help='Пауза между байтами медленного клиента, с.')
+    parser.add_argument('--token',
+                        help='Токен или JWT пользователя: ответы без кэша '
+                             'анонимов.')
+    return parser.parse_args()
+
+
+def restart_backend(compose_file, profile):
+    name, _, interface = profile.partition(':')
+    env = dict(
+        os.environ, DJANGO_PROFILE=name, SERVER_INTERFACE=interface or 'wsgi'
+    )
+    subprocess.run(
+        ('docker-compose', '-f', compose_file, 'up', '-d', '--no-deps',
+         '--force-recreate', 'backend'),
+        env=env, check=True,
+    )
+
+
+def wait_ready(url, timeout=120):
+    parts = urlsplit(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(parts.netloc, timeout=5)
+            connection.request('GET', '/api/tags/')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(1)
+    raise SystemExit(f'{url} не отвечает за {timeout} с')
+
+
+class Worker(threading.Thread):
+    def __init__(self, netloc, requests, headers, stop_at, record_from):
+        super().__init__(daemon=True)
+        self.netloc = netloc
+        self.requests = requests
+        self.headers = headers
+        self.stop_at = stop_at
+        self.record_from = record_from
+        self.latencies = []
+        self.errors = 0
+
+    def run(self):
+        connection = http.client.HTTPConnection(self.netloc, timeout=30)
+        for method, path, body in cycle(self.requests):
+            started = time.monotonic()
+            if started >= self.stop_at:
+                break
+            try:
+                connection.request(method, path, body, headers=self.headers)
+                response = connection.getresponse()
+                response.read()
+                # Повторное добавление или удаление отвечает 4xx штатно.
+                failed = response.status >= (400 if method == 'GET' else 500)
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(
+                    self.netloc, timeout=30
+                )
+                failed = True
+            if started < self.record_from:
+                continue
+            if failed:
+                self.errors += 1
+            else:
+                self.latencies.append(time.monotonic() - started)
+
+
+class SlowClient(threading.Thread):
+    def __init__(self, netloc, path, interval, stop_at):
+        super().__init__(daemon=True)
+        self.netloc = netloc
+        self.request = (
+            f'GET {path} HTTP/1.1\r\nHost: {netloc}\r\n'
+            'Connection: close\r\n\r\n'
+        ).encode()
+        self.interval = interval
+        self.stop_at = stop_at
+
+    def run(self):
+        host, _, port = self.netloc.partition(':')
+        while time.monotonic() < self.stop_at:
+            try:
+                with socket.create_connection(
+                    (host, int(port or 80)), timeout=60
+                ) as connection:
+                    for index in range(len(self.request)):
+                        connection.sendall(self.request[index:index + 1])
+                        time.sleep(self.interval)
+                    while connection.recv(65536):
+                        pass
+            except OSError:
+                time.sleep(self.interval)
+
+
+def run_load(url, requests, headers, concurrency, warmup, duration,
+             slow_clients=(0, 0)):
+    start = time.monotonic()
+    record_from = start + warmup
+    stop_at = record_from + duration
+    count, interval = slow_clients
+    for _ in range(count):
+        SlowClient(
+            urlsplit(url).netloc, requests[0][1], interval, stop_at
+        ).start()
+    workers = []
+    for index in range(concurrency):
+        # Потоки начинают с разных запросов, чтобы не бить в один ресурс.
+        shift = index % len(requests)
+        workers.append(Worker(
+            urlsplit(url).netloc, requests[shift:] + requests[:shift],
+            headers, stop_at, record_from,
+        ))
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    latencies = sorted(
+        latency for worker in workers for latency in worker.latencies
+    )
+    return {
+        'requests': len(latencies),
+        'errors': sum(worker.errors for worker in workers),
+        'rps': len(latencies) / duration,
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+    }
+
+
+def recipe_ids(url, headers, count):
+    connection = http.client.HTTPConnection(urlsplit(url).netloc, timeout=30)
+    connection.request('GET', f'/api/recipes/?limit={count}', headers=headers)
+    return [
+        recipe['id']
+        for recipe in json.load(connection.getresponse())['results']
+    ]
+
+
+def toggle_requests(ids):
+    requests = []
+    for recipe_id in ids:
+        for action in ('favorite', 'shopping_cart'):
+            path = f'/api/recipes/{recipe_id}/{action}/'
+            requests.extend((
+                ('POST', path, None), ('POST', path, None),
+                ('DELETE', path, None), ('DELETE', path, None),
+            ))
+    return requests
+
+
+def bulk_requests(ids):
+    body = json.dumps({'recipes': ids})
+    return [
+        ('POST', '/api/recipes/favorite/', body),
+        ('POST', '/api/recipes/shopping_cart/from_favorites/', None),
+        ('DELETE', '/api/recipes/shopping_cart/', body),
+        ('POST', '/api/recipes/shopping_cart/', body),
+        ('DELETE', '/api/recipes/favorite/', body),
+        ('DELETE', '/api/recipes/shopping_cart/', body),
+    ]
+
+
+def percentile(values, share):
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def report(results):
+    print(
+        f'{"профиль":<24} {"запросов":>9} {"ошибок":>7} {"rps":>9} '
+        f'{"p50 мс":>8} {"p95 мс":>8} {"p99 мс":>8}'
+    )
+    base = None
+    for profile, result in results.items():
+        line = (
+            f'{profile:<24} {result["requests"]:>9} {result["errors"]:>7} '
+            f'{result["rps"]:>9.1f} {result["p50"] * 1000:>8.1f} '
+            f'{result["p95"] * 1000:>8.1f} {result["p99"] * 1000:>8.1f}'
+        )
+        if base is None:
+            base = result['rps']
+        elif base:
+            line += f'  x{result["rps"] / base:.2f}'
+        print(line)
+
+
+def build_requests(args, headers):
+    if args.mode == 'read':
+        return [('GET', path, None) for path in args.paths or DEFAULT_PATHS]
+    if not args.token:
+        raise SystemExit(f'--mode {args.mode} требует --token')
+    ids = recipe_ids(args.url, headers, args.recipes)
+    if args.mode == 'toggle':
+        return toggle_requests(ids)
+    return bulk_requests(ids)
+
+
+def main():
+    args = parse_args()
+    headers = {'Connection': 'keep-alive'}
+    if args.token:
+        scheme = 'Bearer' if args.token.count('.') == 2 else 'Token'
+        headers['Authorization'] = f'{scheme} {args.token}'
+    if args.mode != 'read':
+        headers['Content-Type'] = 'application/json'
+    profiles = ['current'] if args.no_restart else args.profiles
+    results = {}
+    for profile in profiles:
+        if not args.no_restart:
+            restart_backend(args.compose_file, profile)
+        wait_ready(args.url)
+        results[profile] = run_load(
+            args.url, build_requests(args, headers), headers,
+            args.concurrency, args.warmup, args.duration,
+            (args.slow_clients, args.slow_interval),
+        )
+    report(results)
+
+
+if __name__ == '__main__':
+    main()